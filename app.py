@@ -1,22 +1,32 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 import os
 import shutil
 import traceback
-import time
 import mimetypes
+import uuid
+import asyncio
+import numpy as np
 from langdetect import detect as lang_detect
 from typing import List, Optional
 
 # Modules perso
-from utils.action_extractor import extract_emotions_actions
-from utils.translator import translate_text, translate_documents
-from utils.whisper_handler import transcribe_audio_simple
-from utils.rag import build_vectorstore_from_files, query_rag
-from utils.tts_handler import text_to_speech
+from utils.action_extractor import extract_emotions_actions, get_extraction_stats, close_extraction_sink
+from utils.translator import translate_text, translate_documents, get_translation_stats
+from utils.whisper_handler import transcribe_audio_simple, StreamingTranscriber
+from utils.audio_frontend import prepare_audio, trim_silence
+from utils.rag import (
+    IncrementalIndex, INDEX_DIR, query_rag, query_rag_structured, build_rag_prompt, stream_answer_sentences,
+    iter_sentences, lookup_answer, remember_answer
+)
+from utils.ollama_client import close as close_ollama_client
+from utils.tts_handler import text_to_speech, prerender_phrases, get_tts_service, shutdown_tts_service
 from utils.sentiment_analysis import predict_emotion, EMOTION_MAPPING
+from utils.executors import ExecutorBusy, run_in, shutdown_executors, EXECUTORS
+from utils.model_lifecycle import models, READY, FAILED
 
 # Ajouter la reconnaissance des types MIME pour les formats audio
 mimetypes.add_type('audio/webm', '.webm')
@@ -39,19 +49,45 @@ os.makedirs("faiss_index", exist_ok=True)
 
 vectorstore = None
 translated_docs_path = "translated_docs"
+index_manager = IncrementalIndex(INDEX_DIR)
 
-# Charger l'index si documents existants
-if os.path.exists(translated_docs_path) and any(os.scandir(translated_docs_path)):
-    file_paths_for_index = [
+def list_index_files() -> List[str]:
+    return [
         os.path.join(translated_docs_path, f)
         for f in os.listdir(translated_docs_path)
         if f.endswith((".txt", ".pdf", ".docx"))
     ]
-    if file_paths_for_index:
-        vectorstore = build_vectorstore_from_files(file_paths_for_index, "faiss_index")
-        print("[INFO] Vectorstore chargé avec succès au démarrage.")
-    else:
-        print("[⚠] Aucun document supporté trouvé dans translated_docs. Index non chargé.")
+
+def load_index():
+    """Charge l'index persistant si documents existants (ré-embarquement seulement s'il est obsolète)."""
+    global vectorstore
+    if os.path.exists(translated_docs_path) and any(os.scandir(translated_docs_path)):
+        file_paths_for_index = list_index_files()
+        if file_paths_for_index:
+            vectorstore = index_manager.load(file_paths_for_index)
+            print("[INFO] Vectorstore chargé avec succès au démarrage.")
+        else:
+            print("[⚠] Aucun document supporté trouvé dans translated_docs. Index non chargé.")
+    return vectorstore
+
+# Chargé en arrière-plan avec les modèles : le serveur répond dès le démarrage
+models.register("index", load_index)
+
+def save_upload(fileobj, path: str):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f)
+
+@app.on_event("startup")
+def on_startup():
+    # Whisper, émotion, LLM, modèles Marian et index chargés en arrière-plan
+    models.start_background()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_executors()
+    shutdown_tts_service()
+    close_ollama_client()
+    close_extraction_sink()
 
 @app.get("/", response_class=HTMLResponse)
 async def get_home(request: Request):
@@ -84,8 +120,15 @@ async def translate(
                 except Exception as e:
                     print(f"Erreur suppression {file_path}: {e}")
 
+    global vectorstore
     if not files or any(file.filename == "" for file in files):
-        # Juste rafraîchir la liste des fichiers après suppression
+        # Retirer de l'index les fichiers supprimés, puis rafraîchir la liste
+        if delete_files:
+            try:
+                vectorstore = await run_in_threadpool(index_manager.sync, list_index_files())
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Erreur mise à jour de l'index: {e}")
         files_list = []
         if os.path.exists(translated_docs_path):
             files_list = [f for f in os.listdir(translated_docs_path) if os.path.isfile(os.path.join(translated_docs_path, f))]
@@ -136,8 +179,10 @@ async def translate(
     translated_paths = []
     if target_lang and target_lang in ["fr", "en", "ar"]:
         try:
-            translated_paths = translate_documents(
-                temp_paths, 
+            translated_paths = await run_in(
+                "document_translation",
+                translate_documents,
+                temp_paths,
                 src_lang="auto", 
                 tgt_lang=target_lang,
                 output_dir=translated_dir
@@ -171,15 +216,8 @@ async def translate(
             "files": files_list
         })
 
-    file_paths_for_index = [
-        os.path.join(translated_dir, f)
-        for f in os.listdir(translated_dir)
-        if f.endswith((".txt", ".pdf", ".docx"))
-    ]
-
     try:
-        global vectorstore
-        vectorstore = build_vectorstore_from_files(file_paths_for_index, "faiss_index")
+        vectorstore = await run_in_threadpool(index_manager.sync, list_index_files())
     except Exception as e:
         traceback.print_exc()
         files_list = []
@@ -202,12 +240,222 @@ async def translate(
         "files": files_list
     })
 
+# "concurrent" : extraction émotions/actions en parallèle de la synthèse vocale ;
+# "joint" : réponse et émotions/actions produites par une seule génération
+ANSWER_PIPELINE = os.getenv("ANSWER_PIPELINE", "concurrent")
+
+NO_SPEECH_ERROR = "Impossible de transcrire l'audio. Assurez-vous que l'audio contient de la parole."
+BUSY_ERROR = "Serveur saturé, veuillez réessayer dans quelques instants."
+
+def no_index_error():
+    """Message et code HTTP quand aucun vectorstore n'est disponible."""
+    if models.state("index") not in (READY, FAILED):
+        return "Index en cours de chargement, veuillez réessayer dans quelques instants.", 503
+    return "Aucun document chargé. Veuillez d'abord uploader des documents.", 400
+
+async def analyze_question(audio, language: Optional[str] = None):
+    """
+    Transcription et analyse de l'émotion de l'utilisateur, en parallèle sur le
+    même signal. La langue identifiée par Whisper est réutilisée par tout le pipeline.
+    """
+    (question_text, detected_lang), (emotion_label, confidence, _) = await asyncio.gather(
+        run_in("whisper", transcribe_audio_simple, audio, language=language),
+        run_in("emotion", predict_emotion, audio, with_dimensions=False)
+    )
+    if emotion_label != "error":
+        user_emotion = EMOTION_MAPPING.get(emotion_label, "Neutre")
+    else:
+        user_emotion = "Neutre"
+    return question_text, detected_lang, user_emotion
+
+FALLBACK_MESSAGES = {
+    "fr": "Je n'ai pas trouvé d'informations pertinentes pour répondre à votre question.",
+    "en": "I couldn't find relevant information to answer your question.",
+    "ar": "لم أجد معلومات ذات صلة للإجابة على سؤالك."
+}
+
+# Processus de synthèse vocale démarrés avec les modèles
+models.register("tts", get_tts_service, required=False)
+
+# Phrases fixes synthétisées au démarrage : servies instantanément ensuite
+models.register(
+    "tts_fallbacks",
+    lambda: prerender_phrases({lang: [message] for lang, message in FALLBACK_MESSAGES.items()}),
+    required=False
+)
+
+async def fallback_answer(question_text: str, langVoice: str) -> dict:
+    fallback_message = FALLBACK_MESSAGES.get(langVoice, "Je n'ai pas trouvé d'informations pertinentes.")
+
+    audio_path = await run_in("tts", text_to_speech, fallback_message, lang=langVoice, output_dir="tts_output")
+    return {
+        "transcribed_text": question_text,
+        "response": fallback_message,
+        "audio_url": f"/tts_output/{os.path.basename(audio_path)}",
+        "emotions_actions": None,
+        "response_lang": langVoice
+    }
+
+def answer_language(text: str, langVoice: str) -> str:
+    """
+    Langue d'une réponse du LLM. Le prompt est rédigé dans la langue de réponse :
+    une détection hors fr/en/ar (fréquente sur un texte court) est ignorée.
+    """
+    try:
+        src_lang = lang_detect(text)[:2].lower()
+    except Exception:
+        return langVoice
+    return src_lang if src_lang in ["fr", "en", "ar"] else langVoice
+
+async def to_response_language(text: str, langVoice: str, src_lang: Optional[str] = None) -> str:
+    """Traduit le texte dans la langue de réponse si nécessaire (texte d'origine si la traduction échoue)."""
+    if src_lang is None:
+        src_lang = answer_language(text, langVoice)
+    if src_lang == langVoice:
+        return text
+    try:
+        translated = await run_in("translation", translate_text, text, src_lang=src_lang, tgt_lang=langVoice)
+    except ExecutorBusy:
+        raise
+    except Exception as e:
+        print(f"Erreur traduction réponse: {e}")
+        return text
+    return translated or text
+
+async def answer_question(question_text: str, detected_lang: Optional[str], user_emotion: str) -> dict:
+    """RAG, extraction émotions/actions, traduction et synthèse vocale de la réponse."""
+    # Déterminer la langue de réponse (basée sur la langue détectée ou par défaut)
+    langVoice = detected_lang if detected_lang in ["fr", "en", "ar"] else "fr"
+
+    # Recherche RAG en utilisant l'émotion détectée ; en mode « joint », la même
+    # génération produit aussi les émotions/actions
+    emotions_actions = None
+    if ANSWER_PIPELINE == "joint":
+        response_text, emotions_actions = await run_in(
+            "llm",
+            query_rag_structured,
+            question_text,
+            vectorstore,
+            user_emotion=user_emotion,
+            lang=detected_lang,
+            k=5
+        )
+    else:
+        response_text = await run_in(
+            "llm",
+            query_rag,
+            question_text,
+            vectorstore,
+            user_emotion=user_emotion,
+            lang=detected_lang,
+            k=5
+        )
+
+    if not response_text or "Je n'ai pas trouvé" in response_text:
+        return await fallback_answer(question_text, langVoice)
+
+    async def speak():
+        spoken_text = await to_response_language(response_text, langVoice)
+        audio_path = await run_in("tts", text_to_speech, spoken_text, lang=langVoice, output_dir="tts_output")
+        return spoken_text, audio_path
+
+    async def extract():
+        if emotions_actions is not None:
+            return emotions_actions
+        return await run_in("llm", extract_emotions_actions, response_text, langVoice)
+
+    # L'extraction émotions/actions et la traduction + synthèse vocale sont indépendantes
+    (spoken_text, audio_path), emotions_actions = await asyncio.gather(speak(), extract())
+
+    return {
+        "transcribed_text": question_text,
+        "response": spoken_text,
+        "audio_url": f"/tts_output/{os.path.basename(audio_path)}",
+        "emotions_actions": emotions_actions,
+        "response_lang": langVoice
+    }
+
+async def stream_answer(websocket: WebSocket, question_text: str, detected_lang: Optional[str], user_emotion: str):
+    """
+    Réponse en streaming : les tokens du LLM sont regroupés en phrases, chaque
+    phrase est synthétisée dès qu'elle est complète et son URL audio envoyée
+    au client (dans l'ordre) pendant que la suite est encore générée.
+    """
+    langVoice = detected_lang if detected_lang in ["fr", "en", "ar"] else "fr"
+
+    # Question déjà posée sur cette version de l'index : ni recherche ni génération
+    cached = await run_in("llm", lookup_answer, question_text, vectorstore, user_emotion, lang=detected_lang)
+    if cached is None:
+        prompt = await run_in(
+            "llm",
+            build_rag_prompt,
+            question_text,
+            vectorstore,
+            user_emotion=user_emotion,
+            lang=detected_lang,
+            k=5
+        )
+        if prompt is None:
+            await websocket.send_json({"type": "answer", **await fallback_answer(question_text, langVoice)})
+            return
+
+    await websocket.send_json({"type": "transcript", "transcribed_text": question_text, "response_lang": langVoice})
+
+    async def synthesize_and_send(index: int, sentence: str, previous):
+        audio_path = await run_in("tts", text_to_speech, sentence, lang=langVoice, output_dir="tts_output")
+        if previous is not None:
+            await previous  # conserver l'ordre des phrases
+        await websocket.send_json({
+            "type": "sentence",
+            "index": index,
+            "text": sentence,
+            "audio_url": f"/tts_output/{os.path.basename(audio_path)}"
+        })
+
+    if cached is None:
+        sentences = await run_in("llm", stream_answer_sentences, prompt)
+    else:
+        sentences = iter_sentences([cached])
+    original_sentences, spoken_sentences = [], []
+    pending = None
+    src_lang = None
+    while True:
+        sentence = await run_in("llm", next, sentences, None)
+        if sentence is None:
+            break
+        original_sentences.append(sentence)
+        if src_lang is None:
+            # Langue détectée une seule fois, sur la première phrase : langdetect se trompe souvent sur les phrases courtes
+            src_lang = answer_language(sentence, langVoice)
+        sentence = await to_response_language(sentence, langVoice, src_lang)
+        spoken_sentences.append(sentence)
+        pending = asyncio.create_task(synthesize_and_send(len(spoken_sentences) - 1, sentence, pending))
+    if cached is None and original_sentences:
+        await run_in("llm", remember_answer, question_text, vectorstore, " ".join(original_sentences),
+                     user_emotion, lang=detected_lang)
+
+    # Détection d'émotions et actions sur la réponse complète, pendant la synthèse des dernières phrases
+    extraction = run_in("llm", extract_emotions_actions, " ".join(original_sentences), langVoice)
+    if pending is not None:
+        _, emotions_actions = await asyncio.gather(pending, extraction)
+    else:
+        emotions_actions = await extraction
+    await websocket.send_json({
+        "type": "answer",
+        "transcribed_text": question_text,
+        "response": " ".join(spoken_sentences),
+        "audio_url": None,
+        "emotions_actions": emotions_actions,
+        "response_lang": langVoice
+    })
+
 @app.post("/ask_micro")
 async def ask_micro(
     file: UploadFile = File(...)
 ):
     if vectorstore is None:
-        return JSONResponse({"error": "Aucun document chargé. Veuillez d'abord uploader des documents."}, status_code=400)
+        error, status_code = no_index_error()
+        return JSONResponse({"error": error}, status_code=status_code)
 
     # Vérification du type de fichier uniquement par extension (Windows friendly)
     try:
@@ -225,77 +473,34 @@ async def ask_micro(
     if not file_extension:
         file_extension = ".webm"  # extension par défaut
 
-    temp_path = os.path.join("temp_uploads", f"question_{int(time.time())}{file_extension}")
-    with open(temp_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    # Nom unique : plusieurs questions peuvent être traitées dans la même seconde
+    temp_path = os.path.join("temp_uploads", f"question_{uuid.uuid4().hex}{file_extension}")
 
     try:
-        # Transcription
-        question_text, detected_lang = transcribe_audio_simple(temp_path)
-        if not question_text:
-            return JSONResponse({
-                "error": "Impossible de transcrire l'audio. Assurez-vous que l'audio contient de la parole."
-            }, status_code=400)
-
-        # Déterminer la langue de réponse (basée sur la langue détectée ou par défaut)
-        langVoice = detected_lang if detected_lang in ["fr", "en", "ar"] else "fr"
-
-        # Analyse de l'émotion de l'utilisateur
-        emotion_label, confidence, _ = predict_emotion(temp_path)
-        if emotion_label != "error":
-            user_emotion = EMOTION_MAPPING.get(emotion_label, "Neutre")
-        else:
-            user_emotion = "Neutre"
-
-        # Recherche RAG en utilisant l'émotion détectée
-        response_text = query_rag(
-            question_text,
-            vectorstore,
-            user_emotion=user_emotion,
-            k=5,
-            score_threshold=0.7
-        )
-
-        if not response_text or "Je n'ai pas trouvé" in response_text:
-            fallback_message = {
-                "fr": "Je n'ai pas trouvé d'informations pertinentes pour répondre à votre question.",
-                "en": "I couldn't find relevant information to answer your question.",
-                "ar": "لم أجد معلومات ذات صلة للإجابة على سؤالك."
-            }.get(langVoice, "Je n'ai pas trouvé d'informations pertinentes.")
-
-            audio_path = text_to_speech(fallback_message, lang=langVoice, output_dir="tts_output")
-            return JSONResponse({
-                "transcribed_text": question_text,
-                "response": fallback_message,
-                "audio_url": f"/tts_output/{os.path.basename(audio_path)}",
-                "emotions_actions": None,
-                "response_lang": langVoice
-            })
-
-        # Détection d'émotions et actions sur la réponse
-        emotions_actions = extract_emotions_actions(response_text, langVoice)
+        await run_in("io", save_upload, file.file, temp_path)
 
+        # Décodage unique en mémoire (16 kHz mono float32) et suppression des
+        # silences, partagé par les deux modèles
         try:
-            if lang_detect(response_text)[:2].lower() != langVoice:
-                response_text = translate_text(
-                    response_text,
-                    src_lang=lang_detect(response_text),
-                    tgt_lang=langVoice
-                )
+            audio = await run_in("io", prepare_audio, temp_path)
+        except ExecutorBusy:
+            raise
         except Exception as e:
-            print(f"Erreur traduction réponse: {e}")
+            print(f"Erreur décodage audio: {e}")
+            return JSONResponse({"error": "Impossible de décoder le fichier audio."}, status_code=400)
+        if len(audio) == 0:
+            # Pas de parole : inutile de payer Whisper et le classifieur
+            return JSONResponse({"error": NO_SPEECH_ERROR}, status_code=400)
 
-        # Génération audio
-        audio_path = text_to_speech(response_text, lang=langVoice, output_dir="tts_output")
+        question_text, detected_lang, user_emotion = await analyze_question(audio)
+        if not question_text:
+            return JSONResponse({"error": NO_SPEECH_ERROR}, status_code=400)
 
-        return JSONResponse({
-            "transcribed_text": question_text,
-            "response": response_text,
-            "audio_url": f"/tts_output/{os.path.basename(audio_path)}",
-            "emotions_actions": emotions_actions,
-            "response_lang": langVoice
-        })
+        return JSONResponse(await answer_question(question_text, detected_lang, user_emotion))
 
+    except ExecutorBusy as e:
+        print(f"[⚠] {e}")
+        return JSONResponse({"error": BUSY_ERROR}, status_code=503)
     except Exception as e:
         traceback.print_exc()
         return JSONResponse({"error": f"Erreur lors du traitement: {str(e)}"}, status_code=500)
@@ -306,6 +511,72 @@ async def ask_micro(
             except:
                 pass
 
+@app.websocket("/ws/ask_micro")
+async def ws_ask_micro(websocket: WebSocket):
+    """
+    Question vocale en streaming : le client envoie des trames binaires PCM
+    float32 mono 16 kHz pendant qu'il parle (et "end" pour terminer), reçoit
+    des transcriptions partielles, puis la réponse phrase par phrase dès la
+    fin de parole.
+    """
+    await websocket.accept()
+    if vectorstore is None:
+        await websocket.send_json({"type": "error", "error": no_index_error()[0]})
+        await websocket.close()
+        return
+
+    transcriber = StreamingTranscriber()
+    partial_task = None
+
+    async def send_partial(window):
+        # Partiels facultatifs : jamais devant une transcription finale en attente
+        if not EXECUTORS["whisper"].idle:
+            return
+        try:
+            text = await run_in("whisper_partial", transcriber.transcribe_window, window)
+        except ExecutorBusy:
+            return
+        if text:
+            await websocket.send_json({"type": "partial", "text": text})
+
+    try:
+        while not transcriber.end_of_speech:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                due = transcriber.feed(np.frombuffer(message["bytes"], dtype=np.float32))
+                if due and (partial_task is None or partial_task.done()):
+                    partial_task = asyncio.create_task(send_partial(transcriber.next_window()))
+            elif message.get("text") == "end":
+                break
+
+        if partial_task is not None and not partial_task.done():
+            partial_task.cancel()
+        await websocket.send_json({"type": "end_of_speech"})
+
+        # Fin de parole : transcription complète puis RAG sans attendre la fin de l'envoi
+        audio = trim_silence(transcriber.audio)
+        if len(audio):
+            question_text, detected_lang, user_emotion = await analyze_question(audio, language=transcriber.language)
+        else:
+            question_text = ""
+        if not question_text:
+            await websocket.send_json({"type": "error", "error": NO_SPEECH_ERROR})
+        else:
+            await stream_answer(websocket, question_text, detected_lang, user_emotion)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except ExecutorBusy as e:
+        print(f"[⚠] {e}")
+        await websocket.send_json({"type": "error", "error": BUSY_ERROR})
+        await websocket.close()
+    except Exception as e:
+        traceback.print_exc()
+        await websocket.send_json({"type": "error", "error": f"Erreur lors du traitement: {str(e)}"})
+        await websocket.close()
+
 @app.get("/preview/{filename}")
 async def preview_file(filename: str):
     file_path = os.path.join(translated_docs_path, filename)
@@ -326,6 +597,36 @@ async def preview_file(filename: str):
 async def list_audio_files():
     return {"files": [f for f in os.listdir("tts_output") if f.endswith(".mp3")]}
 
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    ready = models.ready()
+    return JSONResponse(
+        {"status": "ready" if ready else "loading", "models": models.status()},
+        status_code=200 if ready else 503
+    )
+
+@app.get("/executors")
+async def executors_stats():
+    return {name: executor.stats() for name, executor in EXECUTORS.items()}
+
+@app.get("/tts_stats")
+async def tts_stats():
+    if models.state("tts") != READY:
+        return {"state": models.state("tts")}
+    return get_tts_service().stats()
+
+@app.get("/translation_stats")
+async def translation_stats():
+    return get_translation_stats()
+
+@app.get("/extraction_stats")
+async def extraction_stats():
+    return get_extraction_stats()
+
 @app.post("/ping_micro")
 async def ping_micro(request: Request):
     return {"message": "Micro client fonctionnel"}
\ No newline at end of file
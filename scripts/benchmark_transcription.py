@@ -0,0 +1,98 @@
+"""
+Compare les moteurs de transcription (latence et WER) sur des fichiers audio.
+
+Exemple :
+    python scripts/benchmark_transcription.py --backends openai:medium faster:medium faster:small
+
+Sans --references (JSON {nom_fichier: transcription}), le WER est calculé
+par rapport au premier moteur de la liste.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.audio_frontend import load_audio, duration_seconds
+from utils.whisper_handler import create_backend
+
+
+def normalize_words(text: str):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # Distance d'édition sur les mots (deux lignes de la matrice)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["openai:medium", "faster:medium"],
+                        help="moteurs à comparer, au format nom:taille")
+    parser.add_argument("--audio", nargs="+", default=sorted(glob.glob("temp_uploads/*.wav")),
+                        help="fichiers audio (par défaut temp_uploads/*.wav)")
+    parser.add_argument("--references", help="JSON {nom_fichier: transcription de référence}")
+    parser.add_argument("--language", default=None, help="langue forcée (par défaut détection automatique)")
+    args = parser.parse_args()
+
+    if not args.audio:
+        parser.error("aucun fichier audio trouvé")
+
+    clips = {os.path.basename(path): load_audio(path) for path in args.audio}
+    references = {}
+    if args.references:
+        with open(args.references, "r", encoding="utf-8") as f:
+            references = json.load(f)
+
+    results = {}
+    for spec in args.backends:
+        name, _, size = spec.partition(":")
+        start = time.perf_counter()
+        backend = create_backend(name, size or "medium")
+        load_seconds = time.perf_counter() - start
+
+        latencies, transcripts = [], {}
+        for clip_name, audio in clips.items():
+            start = time.perf_counter()
+            transcripts[clip_name], _ = backend.transcribe(audio, language=args.language)
+            latencies.append(time.perf_counter() - start)
+            print(f"[{spec}] {clip_name} ({duration_seconds(audio):.1f}s) : {latencies[-1]:.2f}s -> {transcripts[clip_name]}")
+        results[spec] = {"load": load_seconds, "latencies": latencies, "transcripts": transcripts}
+        del backend
+
+    baseline = args.backends[0]
+    print(f"\n{'moteur':<20} {'chargement':>11} {'latence moy.':>13} {'latence max':>12} {'WER':>7}")
+    for spec, result in results.items():
+        wers = [
+            word_error_rate(references.get(clip_name, results[baseline]["transcripts"][clip_name]), text)
+            for clip_name, text in result["transcripts"].items()
+        ]
+        print(
+            f"{spec:<20} {result['load']:>10.1f}s {statistics.mean(result['latencies']):>12.2f}s "
+            f"{max(result['latencies']):>11.2f}s {statistics.mean(wers):>7.1%}"
+        )
+    if not references:
+        print(f"\n(WER calculé par rapport à {baseline})")
+
+
+if __name__ == "__main__":
+    main()
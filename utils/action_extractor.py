@@ -1,80 +1,406 @@
 import json
 import os
-import subprocess
-from datetime import datetime
+import time
+import threading
+
+from utils.jsonl_sink import JsonlSink, read_records
+from utils.lexicon import AhoCorasick, normalize_text
+from utils.ollama_client import OllamaError, generate
+
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 30))
+
+# Vocabulaire fermé par langue : émotions, actions, destinations
+VOCABULARY = {
+    "fr": {
+        "emotions": ["joyeux", "triste", "en colère", "calme", "surpris", "neutre", "encourageant", "curieux", "anxieux", "déterminé", "amusé"],
+        "actions": ["parler", "courir", "danser", "applaudir", "lever_la_main", "rire", "sauter", "marcher", "suis_moi"],
+        "movements": ["marcher", "courir", "suis_moi"],
+        "destinations": ["forêt", "village", "maison", "rivière", "montagne"],
+        "unknown": "inconnue",
+    },
+    "en": {
+        "emotions": ["joyful", "sad", "angry", "calm", "surprised", "neutral", "encouraging", "curious", "anxious", "determined", "amused"],
+        "actions": ["speak", "run", "dance", "applaud", "raise_hand", "laugh", "jump", "walk", "follow_me"],
+        "movements": ["walk", "run", "follow_me"],
+        "destinations": ["forest", "village", "house", "river", "mountain"],
+        "unknown": "unknown",
+    },
+    "ar": {
+        "emotions": ["سعيد", "حزين", "غاضب", "هادئ", "متفاجئ", "محايد", "مشجع", "فضولي", "قلق", "مصمم", "مستمتع"],
+        "actions": ["يتكلم", "يركض", "يرقص", "يصفق", "يرفع_يده", "يضحك", "يقفز", "يمشي", "اتبعني"],
+        "movements": ["يمشي", "يركض", "اتبعني"],
+        "destinations": ["غابة", "قرية", "منزل", "نهر", "جبل"],
+        "unknown": "غير_معروف",
+    },
+}
+
+
+def vocabulary(lang: str) -> dict:
+    return VOCABULARY.get(lang[:2], VOCABULARY["en"])
+
+
+def extraction_schema(lang: str) -> dict:
+    """Schéma JSON imposé au modèle : {"emotions": [...], "actions": [{"action", "destination"}]}."""
+    vocab = vocabulary(lang)
+    return {
+        "type": "object",
+        "properties": {
+            "emotions": {"type": "array", "items": {"type": "string", "enum": vocab["emotions"]}},
+            "actions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "action": {"type": "string", "enum": vocab["actions"]},
+                        "destination": {"type": "string", "enum": vocab["destinations"] + [vocab["unknown"]]}
+                    },
+                    "required": ["action"]
+                }
+            }
+        },
+        "required": ["emotions", "actions"]
+    }
+
+
+def joint_schema(lang: str) -> dict:
+    """Schéma de la génération unique : la réponse et son extraction émotions/actions."""
+    schema = extraction_schema(lang)
+    return {
+        "type": "object",
+        "properties": {"answer": {"type": "string"}, **schema["properties"]},
+        "required": ["answer"] + schema["required"]
+    }
+
+
+def normalize_extraction(data, lang: str) -> dict:
+    """Ne garde que les valeurs du vocabulaire ; destination « inconnue » par défaut pour les déplacements."""
+    vocab = vocabulary(lang)
+    if not isinstance(data, dict):
+        return {"emotions": [], "actions": []}
+    emotions = [e for e in data.get("emotions") or [] if e in vocab["emotions"]]
+    actions = []
+    for item in data.get("actions") or []:
+        if not isinstance(item, dict) or item.get("action") not in vocab["actions"]:
+            continue
+        action = {"action": item["action"]}
+        if item["action"] in vocab["movements"]:
+            destination = item.get("destination")
+            action["destination"] = destination if destination in vocab["destinations"] else vocab["unknown"]
+        actions.append(action)
+    return {"emotions": list(dict.fromkeys(emotions)), "actions": actions}
+
 
 def build_prompt(response_text: str, lang: str) -> str:
+    vocab = vocabulary(lang)
+    emotions = ", ".join(vocab["emotions"])
+    actions = ", ".join(vocab["actions"])
+    destinations = ", ".join(vocab["destinations"])
+    movements = ", ".join(vocab["movements"])
     if lang.startswith("fr"):
         prompt = f"""
 Tu es un assistant qui analyse la réponse d’un chatbot dans un jeu vidéo.
-Liste des émotions possibles : joyeux, triste, en colère, calme, surpris, neutre, encourageant, curieux, anxieux, déterminé, amusé.
-Liste des actions possibles : parler, courir, danser, applaudir, lever_la_main, rire, sauter, marcher, suis_moi.
-Destinations possibles : forêt, village, maison, rivière, montagne.
-Pour chaque action impliquant un déplacement (marcher, courir, suis_moi), ajoute la destination si mentionnée, sinon "inconnue".
+Liste des émotions possibles : {emotions}.
+Liste des actions possibles : {actions}.
+Destinations possibles : {destinations}.
+Pour chaque action impliquant un déplacement ({movements}), ajoute la destination si mentionnée, sinon "{vocab["unknown"]}".
 
 Réponse chatbot :
 {response_text}
-#+ parole qui v etre avec action
-
-Format JSON strict :
-"""
-    elif lang.startswith("en"):
-        prompt = f"""
-You are an assistant analyzing a chatbot response in a video game.
-Possible emotions: joyful, sad, angry, calm, surprised, neutral, encouraging, curious, fearful/anxious, determined, amused.
-Possible actions: speak, run, dance, applaud, raise_hand, laugh, jump, walk, follow_me.
-Possible destinations: forest, village, house, river, mountain.
-For movement actions (walk, run, follow_me), add destination if mentioned, else "unknown".
-
-Chatbot response:
-{response_text}
 
-JSON format:
+Format JSON strict : {{"emotions": [...], "actions": [{{"action": ..., "destination": ...}}]}}
 """
     elif lang.startswith("ar"):
         prompt = f"""
 أنت مساعد يحلل رد شات بوت في لعبة فيديو.
-العواطف المحتملة: سعيد، حزين، غاضب، هادئ، متفاجئ، محايد، مشجع، فضولي، قلق، مصمم، مستمتع.
-الأفعال المحتملة: يتكلم، يركض، يرقص، يصفق، يرفع_يده، يضحك، يقفز، يمشي، اتبعني.
-الوجهات المحتملة: غابة، قرية، منزل، نهر، جبل.
-لكل فعل حركة (يمشي، يركض، اتبعني)، أضف الوجهة إذا وردت وإلا "غير_معروف".
+العواطف المحتملة: {emotions}.
+الأفعال المحتملة: {actions}.
+الوجهات المحتملة: {destinations}.
+لكل فعل حركة ({movements})، أضف الوجهة إذا وردت وإلا "{vocab["unknown"]}".
 
 رد الشات بوت:
 {response_text}
 
-صيغة JSON:
+صيغة JSON: {{"emotions": [...], "actions": [{{"action": ..., "destination": ...}}]}}
 """
     else:
         prompt = f"""
 You are an assistant analyzing a chatbot response in a video game.
-Identify the main emotion and actions.
+Possible emotions: {emotions}.
+Possible actions: {actions}.
+Possible destinations: {destinations}.
+For movement actions ({movements}), add destination if mentioned, else "{vocab["unknown"]}".
+
 Chatbot response:
 {response_text}
 
-JSON format:
+JSON format: {{"emotions": [...], "actions": [{{"action": ..., "destination": ...}}]}}
 """
     return prompt
 
 
-def call_llm(prompt: str) -> str:
-    result = subprocess.run(
-        ["ollama", "run", "llama3"],  
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE
-    )
-    return result.stdout.decode("utf-8").strip()
+def joint_instructions(lang: str) -> str:
+    """Consigne ajoutée au prompt RAG pour obtenir réponse et émotions/actions en une seule génération."""
+    vocab = vocabulary(lang)
+    emotions = ", ".join(vocab["emotions"])
+    actions = ", ".join(vocab["actions"])
+    destinations = ", ".join(vocab["destinations"])
+    if lang.startswith("fr"):
+        return f"""
+
+Réponds en JSON : {{"answer": ta réponse, "emotions": [émotions exprimées par la réponse], "actions": [{{"action": ..., "destination": ...}}]}}.
+Émotions possibles : {emotions}. Actions possibles : {actions}. Destinations possibles : {destinations} (sinon "{vocab["unknown"]}")."""
+    elif lang.startswith("ar"):
+        return f"""
+
+أجب بصيغة JSON: {{"answer": إجابتك, "emotions": [العواطف التي تعبر عنها الإجابة], "actions": [{{"action": ..., "destination": ...}}]}}.
+العواطف المحتملة: {emotions}. الأفعال المحتملة: {actions}. الوجهات المحتملة: {destinations} (وإلا "{vocab["unknown"]}")."""
+    return f"""
+
+Answer in JSON: {{"answer": your answer, "emotions": [emotions expressed by the answer], "actions": [{{"action": ..., "destination": ...}}]}}.
+Possible emotions: {emotions}. Possible actions: {actions}. Possible destinations: {destinations} (else "{vocab["unknown"]}")."""
+
+
+# Formes fléchies reconnues par le chemin rapide, par terme canonique du vocabulaire
+LEXICON = {
+    "fr": {
+        "emotions": {
+            "joyeux": ["joyeux", "joyeuse", "joie", "heureux", "heureuse", "content", "contente", "ravi", "ravie"],
+            "triste": ["triste", "tristes", "tristesse", "malheureux", "malheureuse"],
+            "en colère": ["en colère", "colère", "furieux", "furieuse", "fâché", "fâchée", "énervé", "énervée"],
+            "calme": ["calme", "calmement", "serein", "sereine", "tranquille", "apaisé"],
+            "surpris": ["surpris", "surprise", "étonné", "étonnée", "stupéfait"],
+            "neutre": ["neutre"],
+            "encourageant": ["encourageant", "encourageante", "courage", "bravo", "tu peux y arriver", "vous pouvez y arriver"],
+            "curieux": ["curieux", "curieuse", "curiosité", "intrigué", "intriguée"],
+            "anxieux": ["anxieux", "anxieuse", "inquiet", "inquiète", "stressé", "stressée", "angoissé", "peur"],
+            "déterminé": ["déterminé", "déterminée", "détermination", "résolu", "résolue"],
+            "amusé": ["amusé", "amusée", "drôle", "amusant", "amusante"],
+        },
+        "actions": {
+            "parler": ["parler", "parle", "parles", "parlons", "parlez", "parlent"],
+            "courir": ["courir", "courons", "courez", "courent", "cours vers", "court vers"],
+            "danser": ["danser", "danse", "dansons", "dansez", "dansent"],
+            "applaudir": ["applaudir", "applaudis", "applaudit", "applaudissons", "applaudissez", "applaudissent", "applaudissements"],
+            "lever_la_main": ["lever la main", "lève la main", "levez la main", "levons la main", "lève ta main", "levez vos mains"],
+            "rire": ["rire", "ris", "rit", "rions", "riez", "rient", "haha"],
+            "sauter": ["sauter", "saute", "sautons", "sautez", "sautent", "bondir", "bondis"],
+            "marcher": ["marcher", "marchons", "marchez", "marchent", "promenons nous"],
+            "suis_moi": ["suis moi", "suivez moi", "suis nous", "suivez nous", "viens avec moi", "venez avec moi"],
+        },
+        "destinations": {
+            "forêt": ["forêt", "forêts", "bois"],
+            "village": ["village", "villages", "hameau"],
+            "maison": ["maison", "maisons", "chez moi", "chez nous"],
+            "rivière": ["rivière", "rivières", "fleuve", "ruisseau"],
+            "montagne": ["montagne", "montagnes", "sommet"],
+        },
+        "negations": ["ne", "n", "jamais", "aucun", "aucune"],
+    },
+    "en": {
+        "emotions": {
+            "joyful": ["joyful", "joy", "happy", "glad", "delighted", "cheerful"],
+            "sad": ["sad", "sadness", "unhappy", "sorrow"],
+            "angry": ["angry", "anger", "furious", "annoyed"],
+            "calm": ["calm", "calmly", "serene", "relaxed", "peaceful"],
+            "surprised": ["surprised", "surprise", "amazed", "astonished", "wow"],
+            "neutral": ["neutral"],
+            "encouraging": ["encouraging", "encourage", "you can do it", "keep going", "well done", "great job"],
+            "curious": ["curious", "curiosity", "intrigued"],
+            "anxious": ["anxious", "anxiety", "worried", "nervous", "afraid", "fear", "fearful", "scared"],
+            "determined": ["determined", "determination", "resolute"],
+            "amused": ["amused", "funny", "amusing"],
+        },
+        "actions": {
+            "speak": ["speak", "speaks", "speaking", "talk", "talks", "talking"],
+            "run": ["run", "runs", "running", "ran"],
+            "dance": ["dance", "dances", "dancing", "danced"],
+            "applaud": ["applaud", "applauds", "applauding", "applause", "clap", "clapping"],
+            "raise_hand": ["raise your hand", "raise your hands", "raise hand", "raising hand", "hands up"],
+            "laugh": ["laugh", "laughs", "laughing", "laughed", "haha"],
+            "jump": ["jump", "jumps", "jumping", "jumped"],
+            "walk": ["walk", "walks", "walking", "walked"],
+            "follow_me": ["follow me", "follow us", "come with me", "come along"],
+        },
+        "destinations": {
+            "forest": ["forest", "forests", "woods"],
+            "village": ["village", "villages"],
+            "house": ["house", "houses", "home"],
+            "river": ["river", "rivers", "stream"],
+            "mountain": ["mountain", "mountains", "peak"],
+        },
+        "negations": ["not", "never", "no", "don't", "doesn't", "can't", "won't"],
+    },
+    "ar": {
+        "emotions": {
+            "سعيد": ["سعيد", "سعيدة", "سعادة", "فرح", "مسرور"],
+            "حزين": ["حزين", "حزينة", "حزن"],
+            "غاضب": ["غاضب", "غاضبة", "غضب"],
+            "هادئ": ["هادئ", "هادئة", "هدوء"],
+            "متفاجئ": ["متفاجئ", "متفاجئة", "مندهش", "دهشة"],
+            "محايد": ["محايد"],
+            "مشجع": ["مشجع", "تشجيع", "أحسنت"],
+            "فضولي": ["فضولي", "فضول"],
+            "قلق": ["قلق", "قلقة", "خائف", "خوف", "متوتر"],
+            "مصمم": ["مصمم", "مصممة", "عزيمة", "إصرار"],
+            "مستمتع": ["مستمتع", "ممتع", "مضحك"],
+        },
+        "actions": {
+            "يتكلم": ["يتكلم", "تكلم", "يتحدث", "تحدث", "نتحدث"],
+            "يركض": ["يركض", "اركض", "ركض", "نركض", "اركضوا"],
+            "يرقص": ["يرقص", "ارقص", "رقص", "نرقص"],
+            "يصفق": ["يصفق", "صفق", "تصفيق", "نصفق"],
+            "يرفع_يده": ["يرفع يده", "ارفع يدك", "ارفعوا أيديكم", "رفع اليد"],
+            "يضحك": ["يضحك", "اضحك", "ضحك", "نضحك"],
+            "يقفز": ["يقفز", "اقفز", "قفز", "نقفز"],
+            "يمشي": ["يمشي", "امش", "امشي", "مشى", "نمشي"],
+            "اتبعني": ["اتبعني", "اتبعوني", "تعال معي", "تعالوا معي"],
+        },
+        "destinations": {
+            "غابة": ["غابة", "غابات"],
+            "قرية": ["قرية", "قرى"],
+            "منزل": ["منزل", "بيت"],
+            "نهر": ["نهر", "أنهار"],
+            "جبل": ["جبل", "جبال"],
+        },
+        "negations": ["لا", "لم", "لن", "ليس"],
+    },
+}
+# Préfixes arabes collés au mot (conjonctions, prépositions, article)
+ARABIC_PREFIXES = ("ال", "و", "ف", "ب", "ل", "ك", "س", "وال", "فال", "بال", "كال", "لل", "وس")
 
+# Confiance minimale pour se passer du LLM : émotion (0,5) + action (0,4)
+# + destinations résolues (0,1) ; une négation plafonne la confiance à 0,3,
+# un déplacement sans destination reconnue à 0,5 (cas douteux laissé au LLM)
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", 0.9))
 
-def save_to_json(data: dict, filename: str) -> None:
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-    print(f"[✅ Fichier sauvegardé : {filename}]")
+_matchers = {}
+_stats = {"calls": 0, "fast_path": 0, "llm": 0}
+_stats_lock = threading.Lock()
+
+
+def _matcher(lang: str) -> AhoCorasick:
+    if lang not in _matchers:
+        lexicon = LEXICON[lang]
+        patterns = [
+            (normalize_text(form), (kind, term))
+            for kind in ("emotions", "actions", "destinations")
+            for term, forms in lexicon[kind].items()
+            for form in forms
+        ]
+        patterns += [(normalize_text(form), ("negation", form)) for form in lexicon["negations"]]
+        _matchers[lang] = AhoCorasick(patterns)
+    return _matchers[lang]
+
+
+def fast_extract(response_text: str, lang: str):
+    """
+    Extraction par lexique (automate d'Aho–Corasick sur les formes fléchies).
+    Retourne (données, confiance entre 0 et 1).
+    """
+    code = lang[:2] if lang[:2] in LEXICON else "en"
+    vocab = vocabulary(code)
+    text = normalize_text(response_text)
+    matches = _matcher(code).find_words(text, prefixes=ARABIC_PREFIXES if code == "ar" else ())
+
+    emotions, actions, negated = [], [], False
+    for index, (_, _, (kind, term)) in enumerate(matches):
+        if kind == "emotions":
+            emotions.append(term)
+        elif kind == "negation":
+            negated = True
+        elif kind == "actions":
+            action = {"action": term}
+            if term in vocab["movements"]:
+                # Destination : la première citée après l'action, avant l'action suivante
+                action["destination"] = vocab["unknown"]
+                for _, _, (next_kind, next_term) in matches[index + 1:]:
+                    if next_kind == "actions":
+                        break
+                    if next_kind == "destinations":
+                        action["destination"] = next_term
+                        break
+            actions.append(action)
+
+    data = normalize_extraction({"emotions": emotions, "actions": actions}, code)
+    confidence = 0.0
+    if data["emotions"]:
+        confidence += 0.5
+    if data["actions"]:
+        confidence += 0.4
+    unresolved = any(a.get("destination") == vocab["unknown"] for a in data["actions"])
+    if not unresolved:
+        confidence += 0.1
+    else:
+        confidence = min(confidence, 0.5)
+    if negated:
+        confidence = min(confidence, 0.3)
+    return data, round(confidence, 2)
+
+
+def get_extraction_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["fast_path_hit_rate"] = round(stats["fast_path"] / stats["calls"], 3) if stats["calls"] else 0.0
+    return stats
+
+
+def _count(path: str):
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats[path] += 1
+
+
+def call_llm(prompt: str, schema: dict = None) -> str:
+    # Client HTTP partagé (connexions persistantes, modèle déjà chargé), sortie JSON
+    return generate(prompt, format=schema or "json", options={"temperature": 0}, timeout=EXTRACTION_TIMEOUT)
+
+
+# Journal des extractions (output/emotions_actions/*.jsonl), relu par read_extractions
+EXTRACTION_LOG_DIR = os.path.join("output", "emotions_actions")
+EXTRACTION_LOG_PREFIX = "emotions_actions"
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_extraction_sink() -> JsonlSink:
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = JsonlSink(EXTRACTION_LOG_DIR, EXTRACTION_LOG_PREFIX)
+        return _sink
+
+
+def close_extraction_sink() -> None:
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+def read_extractions(since: float = None, until: float = None, lang: str = None):
+    """Extractions enregistrées entre deux timestamps, filtrées par langue si demandé."""
+    where = (lambda record: record.get("lang") == lang) if lang else None
+    return read_records(EXTRACTION_LOG_DIR, EXTRACTION_LOG_PREFIX, since=since, until=until, where=where)
 
 
 def extract_emotions_actions(response_text: str, lang: str):
+    # Chemin rapide : le lexique suffit quand la confiance est élevée
+    data, confidence = fast_extract(response_text, lang)
+    if confidence >= FAST_PATH_THRESHOLD:
+        _count("fast_path")
+        print(f"[⚡] Émotions/actions extraites par le lexique (confiance {confidence:.2f})")
+        record_extraction(data, lang, source="lexicon")
+        return data
+
+    _count("llm")
     prompt = build_prompt(response_text, lang)
-    llm_response = call_llm(prompt)
+    try:
+        llm_response = call_llm(prompt, extraction_schema(lang))
+    except OllamaError as e:
+        print(f"[❌ Erreur LLM] {e}")
+        return None
 
     try:
         data = json.loads(llm_response)
@@ -83,12 +409,16 @@ def extract_emotions_actions(response_text: str, lang: str):
         print("[ℹ] Contenu brut :", llm_response)
         return None
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"output/emotions_actions_{lang}_{timestamp}.json"
-    save_to_json(data, filename)
+    data = normalize_extraction(data, lang)
+    record_extraction(data, lang)
     return data
 
 
+def record_extraction(data: dict, lang: str, source: str = "llm") -> None:
+    """Ajoute l'extraction au journal JSONL (écriture par lots en arrière-plan)."""
+    get_extraction_sink().write({"ts": time.time(), "lang": lang, "source": source, **data})
+
+
 def main():
     while True:
         lang = input("Langue (fr/en/ar ou 'quit' pour sortir) : ").strip().lower()
@@ -0,0 +1,92 @@
+# audio_frontend.py
+import numpy as np
+from pydub import AudioSegment
+
+# Format attendu par Whisper et par le classifieur wav2vec2
+SAMPLE_RATE = 16000
+
+
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Décode un fichier audio (webm, mp3, wav...) une seule fois, en mémoire :
+    signal mono float32 dans [-1, 1] échantillonné à sample_rate.
+    Le même buffer est ensuite partagé par Whisper et l'analyse d'émotion.
+    """
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_frame_rate(sample_rate).set_channels(1).set_sample_width(2)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.int16)
+    return samples.astype(np.float32) / 32768.0
+
+
+def duration_seconds(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> float:
+    return len(audio) / sample_rate
+
+
+# Détection d'activité vocale (VAD) par énergie, trames de 30 ms
+VAD_FRAME_MS = 30
+VAD_ENERGY_THRESHOLD = 0.01   # RMS minimal d'une trame de parole
+VAD_NOISE_FACTOR = 2.5        # seuil relevé au-dessus du bruit de fond estimé
+VAD_MAX_NOISE_FLOOR = 0.02    # plafond du bruit estimé (parole continue sans silence)
+VAD_PADDING_MS = 200          # marge conservée autour de chaque segment de parole
+VAD_MIN_SPEECH_MS = 250       # en dessous, l'enregistrement est considéré vide
+
+
+def frame_energies(audio: np.ndarray, frame_samples: int) -> np.ndarray:
+    """RMS de chaque trame complète du signal."""
+    n_frames = len(audio) // frame_samples
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * frame_samples].reshape(n_frames, frame_samples)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def speech_segments(audio: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """Segments de parole [(début, fin)] en échantillons, marges incluses."""
+    frame_samples = int(sample_rate * VAD_FRAME_MS / 1000)
+    energies = frame_energies(audio, frame_samples)
+    if len(energies) == 0:
+        return []
+
+    # 10e percentile : suppose ~10 % de silence ; plafonné pour un enregistrement
+    # recadré sur la parole, où il mesurerait les trames de parole les plus faibles
+    noise_floor = min(float(np.percentile(energies, 10)), VAD_MAX_NOISE_FLOOR)
+    threshold = max(VAD_ENERGY_THRESHOLD, noise_floor * VAD_NOISE_FACTOR)
+    voiced = np.flatnonzero(energies >= threshold)
+    if len(voiced) * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        # Seuil adaptatif trop haut mais énergie nettement au-dessus du seuil
+        # absolu : on garde l'enregistrement entier plutôt que de le rejeter
+        loud = np.count_nonzero(energies >= VAD_ENERGY_THRESHOLD * VAD_NOISE_FACTOR)
+        if loud * VAD_FRAME_MS >= VAD_MIN_SPEECH_MS:
+            return [(0, len(audio))]
+        return []
+
+    padding = int(VAD_PADDING_MS / VAD_FRAME_MS)
+    segments = []
+    start = end = voiced[0]
+    for frame in voiced[1:]:
+        if frame - end > 2 * padding:
+            segments.append((start, end))
+            start = frame
+        end = frame
+    segments.append((start, end))
+
+    return [
+        (max(0, (start - padding) * frame_samples), min(len(audio), (end + 1 + padding) * frame_samples))
+        for start, end in segments
+    ]
+
+
+def trim_silence(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Ne garde que les segments de parole ; tableau vide si aucune parole."""
+    segments = speech_segments(audio, sample_rate)
+    if not segments:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate([audio[start:end] for start, end in segments])
+
+
+def prepare_audio(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Décodage unique puis suppression des silences : entrée commune de Whisper et du classifieur."""
+    audio = load_audio(path, sample_rate)
+    speech = trim_silence(audio, sample_rate)
+    print(f"[i] VAD : {duration_seconds(audio, sample_rate):.1f}s -> {duration_seconds(speech, sample_rate):.1f}s de parole")
+    return speech
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+
+
+class ExecutorBusy(RuntimeError):
+    """Levée quand la file d'attente d'une étape est pleine."""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class StageExecutor:
+    """
+    Pool de threads dédié à une étape du pipeline (Whisper, émotion, LLM...).
+    max_workers appels s'exécutent en parallèle, jusqu'à max_queue autres
+    attendent leur tour ; au-delà, run() lève ExecutorBusy au lieu d'accumuler
+    des requêtes sans limite.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise ExecutorBusy(f"Étape '{self.name}' saturée ({self._pending} requêtes en cours)")
+            self._pending += 1
+        try:
+            future = self._executor.submit(partial(func, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # La place est libérée quand le thread a fini, pas quand l'appelant
+        # abandonne (annulation) : le calcul continue de l'occuper
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    @property
+    def idle(self) -> bool:
+        """Aucun appel en cours ni en attente."""
+        return self._pending == 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Concurrence par étape, configurable via variables d'environnement
+# (ex. WHISPER_WORKERS=2 WHISPER_QUEUE=16)
+_STAGES = {
+    "io": (8, 64),
+    "whisper": (1, 8),
+    "whisper_partial": (1, 4),  # transcriptions partielles du streaming, sans retarder les finales
+    "emotion": (1, 8),
+    "llm": (2, 16),
+    "translation": (1, 8),
+    "document_translation": (1, 4),  # /translate : documents entiers, longs
+    "tts": (4, 32),  # threads en attente du pool de processus TTS
+}
+
+EXECUTORS: Dict[str, StageExecutor] = {
+    name: StageExecutor(
+        name,
+        max_workers=_env_int(f"{name.upper()}_WORKERS", workers),
+        max_queue=_env_int(f"{name.upper()}_QUEUE", queue)
+    )
+    for name, (workers, queue) in _STAGES.items()
+}
+
+
+async def run_in(stage: str, func: Callable, *args, **kwargs):
+    """Exécute func hors de la boucle d'événements, dans le pool de l'étape donnée."""
+    return await EXECUTORS[stage].run(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    for executor in EXECUTORS.values():
+        executor.shutdown()
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class JsonlSink:
+    """
+    Journal JSONL en ajout seul : les enregistrements sont mis en tampon en
+    mémoire puis écrits par lots par un thread d'arrière-plan, dans des
+    segments `{prefix}-{date}-{pid}-{n}.jsonl` (un par processus écrivain) renouvelés au-delà de max_bytes ou
+    de max_seconds. write() ne touche jamais le disque.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_seconds: float = 3600,
+        flush_interval: float = 1.0,
+        batch_size: int = 256
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # un seul écrivain : le thread d'arrière-plan ou close()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._file = None
+        self._segment_started = 0.0
+        self._sequence = 0
+        self.written = 0
+
+        self._thread = threading.Thread(target=self._run, name=f"jsonl-{prefix}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Journal '{self.prefix}' fermé")
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        with self._write_lock:
+            if self._file is not None and self._should_rotate():
+                self._file.close()
+                self._file = None
+            if not lines:
+                return
+            if self._file is None:
+                self._open_segment()
+            self._file.write("".join(lines))
+            self._file.flush()
+            self.written += len(lines)
+
+    def _should_rotate(self) -> bool:
+        return (
+            self._file.tell() >= self.max_bytes
+            or time.time() - self._segment_started >= self.max_seconds
+        )
+
+    def _open_segment(self):
+        self._segment_started = time.time()
+        stamp = datetime.fromtimestamp(self._segment_started).strftime(SEGMENT_TIME_FORMAT)
+        while True:
+            self._sequence += 1
+            # pid dans le nom : chaque worker uvicorn écrit ses propres segments
+            path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl")
+            if not os.path.exists(path):
+                break
+        self._file = open(path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# --- Lecture (jobs d'analyse) ---
+
+def _segment_start(filename: str, prefix: str) -> Optional[float]:
+    stamp = filename[len(prefix) + 1:len(prefix) + 1 + len("20240101-000000")]
+    try:
+        return datetime.strptime(stamp, SEGMENT_TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def list_segments(directory: str, prefix: str, since: Optional[float] = None, until: Optional[float] = None) -> List[str]:
+    """
+    Segments du journal dans l'ordre chronologique de création. Un segment
+    couvre [début lu dans son nom, date de sa dernière écriture (mtime)] :
+    ceux qui ne recoupent pas [since, until] sont écartés sans être ouverts.
+    Plusieurs processus écrivent en parallèle, la fin d'un segment ne peut
+    donc pas se déduire du début du suivant.
+    """
+    if not os.path.isdir(directory):
+        return []
+    segments = sorted(
+        (start, name)
+        for name in os.listdir(directory)
+        if name.startswith(prefix + "-") and name.endswith(".jsonl")
+        for start in [_segment_start(name, prefix)]
+        if start is not None
+    )
+    selected = []
+    for start, name in segments:
+        if until is not None and start > until:
+            break
+        path = os.path.join(directory, name)
+        if since is not None:
+            try:
+                if os.path.getmtime(path) < since:
+                    continue
+            except OSError:
+                continue
+        selected.append(path)
+    return selected
+
+
+def read_records(
+    directory: str,
+    prefix: str,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    time_field: str = "ts"
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt les enregistrements des segments concernés, en flux. La dernière
+    ligne d'un segment en cours d'écriture peut être incomplète : elle est ignorée.
+    """
+    for path in list_segments(directory, prefix, since, until):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                timestamp = record.get(time_field)
+                if since is not None and timestamp is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp is not None and timestamp > until:
+                    continue
+                if where is None or where(record):
+                    yield record
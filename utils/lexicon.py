@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents ni diacritiques arabes, ponctuation remplacée par des espaces."""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("ـ", "")  # tatweel
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+class AhoCorasick:
+    """
+    Automate d'Aho–Corasick : recherche simultanée de tous les motifs d'un
+    lexique en un seul parcours du texte, quel que soit leur nombre.
+    Chaque motif est associé à une valeur (ex. le terme canonique).
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, object]]] = [[]]
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern: str, value):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((len(pattern), value))
+
+    def _build(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, target in self._goto[state].items():
+                pending.append(target)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[target] = self._goto[fallback].get(char, 0)
+                self._output[target] = self._output[target] + self._output[self._fail[target]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, object]]:
+        """Toutes les occurrences (début, fin, valeur), chevauchements compris."""
+        matches = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._output[state]:
+                matches.append((index + 1 - length, index + 1, value))
+        return matches
+
+    def find_words(self, text: str, prefixes: Tuple[str, ...] = ()) -> List[Tuple[int, int, object]]:
+        """
+        Occurrences limitées aux mots entiers, les plus longues d'abord, sans
+        chevauchement. prefixes : préfixes collés autorisés (ex. articles arabes).
+        """
+        candidates = []
+        for start, end, value in self.find_all(text):
+            if end < len(text) and text[end].isalnum():
+                continue
+            word_start = start
+            while word_start > 0 and text[word_start - 1].isalnum():
+                word_start -= 1
+            if word_start != start and text[word_start:start] not in prefixes:
+                continue
+            candidates.append((start, end, value))
+
+        selected, taken = [], []
+        for start, end, value in sorted(candidates, key=lambda m: (m[0] - m[1], m[0])):
+            if all(end <= s or start >= e for s, e in taken):
+                selected.append((start, end, value))
+                taken.append((start, end))
+        return sorted(selected)
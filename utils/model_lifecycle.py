@@ -0,0 +1,103 @@
+import os
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# Modèles à ne charger qu'à la première utilisation (ex. LAZY_MODELS=emotion,translation)
+LAZY_MODELS = {name.strip() for name in os.getenv("LAZY_MODELS", "").split(",") if name.strip()}
+
+
+class ModelLifecycle:
+    """
+    Cycle de vie des modèles : chaque module enregistre un chargeur, les
+    modèles « eager » sont chargés en arrière-plan au démarrage du serveur,
+    les autres à leur première utilisation. get() bloque jusqu'à ce que le
+    modèle soit prêt (un seul chargement à la fois par modèle).
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], eager: bool = True, required: bool = True):
+        """required : le serveur n'est « prêt » que lorsque ce modèle est chargé (s'il est eager)."""
+        with self._lock:
+            self._entries[name] = {
+                "loader": loader,
+                "eager": eager and name not in LAZY_MODELS,
+                "required": required,
+                "state": PENDING,
+                "value": None,
+                "error": None,
+                "load_seconds": None,
+                "lock": threading.Lock()
+            }
+
+    def get(self, name: str):
+        entry = self._entries[name]
+        if entry["state"] == READY:
+            return entry["value"]
+        with entry["lock"]:
+            if entry["state"] != READY:
+                self._load(name, entry)
+            if entry["state"] == FAILED:
+                raise RuntimeError(f"Modèle '{name}' indisponible : {entry['error']}")
+            return entry["value"]
+
+    def _load(self, name: str, entry: Dict[str, Any]):
+        entry["state"], entry["error"] = LOADING, None
+        start = time.perf_counter()
+        logger.info(f"Chargement du modèle '{name}'...")
+        try:
+            entry["value"] = entry["loader"]()
+            entry["state"] = READY
+            entry["load_seconds"] = round(time.perf_counter() - start, 2)
+            logger.info(f"Modèle '{name}' prêt en {entry['load_seconds']}s")
+        except Exception as e:
+            entry["state"], entry["error"] = FAILED, str(e)
+            logger.error(f"Échec du chargement du modèle '{name}' : {e}")
+
+    def start_background(self):
+        """Lance le chargement de tous les modèles eager, chacun dans son thread."""
+        for name, entry in self._entries.items():
+            if entry["eager"] and entry["state"] == PENDING:
+                threading.Thread(target=self._load_quietly, args=(name,), name=f"load-{name}", daemon=True).start()
+
+    def _load_quietly(self, name: str):
+        try:
+            self.get(name)
+        except RuntimeError:
+            pass  # état FAILED déjà enregistré
+
+    def state(self, name: str) -> str:
+        return self._entries[name]["state"]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "state": entry["state"],
+                "eager": entry["eager"],
+                "required": entry["required"],
+                "load_seconds": entry["load_seconds"],
+                "error": entry["error"]
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def ready(self) -> bool:
+        return all(
+            entry["state"] == READY
+            for entry in self._entries.values()
+            if entry["eager"] and entry["required"]
+        )
+
+
+models = ModelLifecycle()
@@ -0,0 +1,103 @@
+import os
+import json
+from typing import Any, Dict, Iterable, Optional, Union
+
+import httpx
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Un seul modèle pour la réponse RAG et l'extraction : il reste chargé (chaud) dans Ollama
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 60))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 8))
+
+
+class OllamaError(RuntimeError):
+    """Serveur Ollama injoignable, trop lent ou réponse invalide."""
+
+
+# Pool de connexions HTTP persistantes, partagé avec OllamaLLM (langchain)
+transport = httpx.HTTPTransport(
+    limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+    retries=1
+)
+_client = httpx.Client(
+    base_url=OLLAMA_BASE_URL,
+    transport=transport,
+    timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0)
+)
+
+
+# Transport asynchrone distinct : un HTTPTransport ne sait pas traiter les requêtes async
+async_transport = httpx.AsyncHTTPTransport(
+    limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+    retries=1
+)
+
+
+def shared_client_kwargs(supported_fields: Iterable[str]) -> Dict[str, Any]:
+    """
+    Arguments d'OllamaLLM (langchain) pour réutiliser le pool de connexions :
+    transport synchrone pour le client sync, asynchrone pour le client async.
+    Les versions de langchain-ollama sans sync_client_kwargs/async_client_kwargs
+    transmettent client_kwargs aux deux clients : le transport n'est alors pas partagé.
+    """
+    kwargs: Dict[str, Any] = {"client_kwargs": {"timeout": OLLAMA_TIMEOUT}}
+    if {"sync_client_kwargs", "async_client_kwargs"} <= set(supported_fields):
+        kwargs["sync_client_kwargs"] = {"transport": transport}
+        kwargs["async_client_kwargs"] = {"transport": async_transport}
+    return kwargs
+
+
+def generate(
+    prompt: str,
+    model: str = OLLAMA_MODEL,
+    format: Optional[Union[str, Dict[str, Any]]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None
+) -> str:
+    """
+    Génération complète (sans streaming) via /api/generate.
+    format : "json" ou un schéma JSON pour contraindre la sortie.
+    """
+    payload = {"model": model, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if format is not None:
+        payload["format"] = format
+    if options:
+        payload["options"] = options
+    try:
+        response = _client.post("/api/generate", json=payload, timeout=timeout or OLLAMA_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["response"].strip()
+    except httpx.TimeoutException as e:
+        raise OllamaError(f"Ollama n'a pas répondu en {timeout or OLLAMA_TIMEOUT:.0f}s") from e
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        raise OllamaError(f"Appel Ollama impossible : {e}") from e
+
+
+def generate_json(
+    prompt: str,
+    schema: Optional[Dict[str, Any]] = None,
+    model: str = OLLAMA_MODEL,
+    timeout: Optional[float] = None
+) -> Any:
+    """Génération en mode JSON (sortie contrainte par le schéma s'il est fourni), décodée."""
+    text = generate(prompt, model=model, format=schema or "json", options={"temperature": 0}, timeout=timeout)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise OllamaError(f"JSON invalide renvoyé par le modèle : {text[:200]}") from e
+
+
+def warm_up(model: str = OLLAMA_MODEL) -> None:
+    """Charge le modèle dans Ollama et le garde en mémoire OLLAMA_KEEP_ALIVE."""
+    try:
+        response = _client.post("/api/generate", json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE})
+        response.raise_for_status()
+        print(f"[✅] Modèle Ollama '{model}' chargé (keep_alive={OLLAMA_KEEP_ALIVE})")
+    except httpx.HTTPError as e:
+        print(f"[⚠] Préchargement du modèle Ollama '{model}' impossible : {e}")
+
+
+def close() -> None:
+    _client.close()
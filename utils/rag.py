@@ -1,134 +1,613 @@
 import os
+import re
+import json
 import shutil
-import fitz  # PyMuPDF
-import docx
-from typing import List
+import time
+import hashlib
+import threading
+import unicodedata
+import weakref
+from contextlib import contextmanager
+from collections import OrderedDict
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
+from langchain.embeddings.base import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaLLM
 from langchain_openai import OpenAIEmbeddings
 from langdetect import detect as lang_detect
 
+from utils.action_extractor import joint_instructions, joint_schema, normalize_extraction, record_extraction
+from utils.disk_cache import DiskLRUCache
+from utils.model_lifecycle import models
+from utils.ollama_client import (
+    OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OllamaError, generate_json, shared_client_kwargs, warm_up
+)
+from utils.text_extraction import file_hash, iter_pages
+
 # EmbeddingType enum simplifié
 class EmbeddingType:
     LOCAL = "local"
     OPENAI = "openai"
     HUGGINGFACE = "huggingface"
 
-llm = OllamaLLM(model="llama3.2:1b", base_url="http://localhost:11434")
+def _load_llm():
+    # Même pool de connexions que l'extracteur d'actions, modèle maintenu chargé
+    llm = OllamaLLM(
+        model=OLLAMA_MODEL,
+        base_url=OLLAMA_BASE_URL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        **shared_client_kwargs(OllamaLLM.model_fields)
+    )
+    warm_up(OLLAMA_MODEL)
+    return llm
+
+models.register("llm", _load_llm)
+
+def get_llm() -> OllamaLLM:
+    return models.get("llm")
 
 INDEX_DIR = "faiss_index"
+MANIFEST_FILE = "manifest.json"
+
+# Découpage des documents pour l'indexation
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+# Embeddings : taille des lots, lots envoyés en parallèle, cache disque
+# Distance FAISS maximale d'un passage retenu (non définie : les k plus proches).
+# L'échelle dépend du modèle d'embeddings, d'où l'absence de valeur par défaut.
+RAG_MAX_DISTANCE = float(os.environ["RAG_MAX_DISTANCE"]) if os.getenv("RAG_MAX_DISTANCE") else None
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_CONCURRENCY = 4
+EMBEDDING_CACHE_PATH = os.path.join("cache", "embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
 
 def clean_index(folder: str):
     if os.path.exists(folder):
         shutil.rmtree(folder)
     os.makedirs(folder)
 
-def load_documents(file_paths: List[str]) -> List[Document]:
+def load_documents(
+    file_paths: List[str],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> List[Document]:
     """
     Charge et lit plusieurs fichiers (.txt, .pdf, .docx) directement.
     Chaque chemin dans file_paths doit être un fichier, pas un dossier.
+    Le texte est découpé en chunks (taille / recouvrement configurables) sans
+    franchir les frontières de pages ; chaque chunk porte source, page et offset.
     """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True
+    )
     docs = []
     for path in file_paths:
         filename = os.path.basename(path)
         try:
-            content = ""
-            if filename.endswith(".txt"):
-                with open(path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            elif filename.endswith(".pdf"):
-                with fitz.open(path) as doc:
-                    for page in doc:
-                        content += page.get_text()
-            elif filename.endswith(".docx"):
-                docx_file = docx.Document(path)
-                content = "\n".join([para.text for para in docx_file.paragraphs])
-            else:
-                print(f"[⚠] Format non supporté : {filename}")
-                continue
+            sections = [(page, text) for page, text in iter_pages(path) if text.strip()]
+        except ValueError as e:
+            print(f"[⚠] {e}")
+            continue
+        except Exception as e:
+            print(f"[❌] Erreur fichier {filename} : {e}")
+            continue
 
-            if content.strip():
-                try:
-                    lang = lang_detect(content[:500])
-                except:
-                    lang = "unknown"
+        if not sections:
+            continue
+
+        try:
+            lang = lang_detect(sections[0][1][:500])
+        except:
+            lang = "unknown"
 
+        chunk_id = 0
+        for page, text in sections:
+            for chunk in splitter.create_documents([text]):
                 docs.append(Document(
-                    page_content=content,
+                    page_content=chunk.page_content,
                     metadata={
                         "source": filename,
                         "lang": lang,
-                        "file_path": path
+                        "file_path": path,
+                        "page": page,
+                        "offset": chunk.metadata.get("start_index", 0),
+                        "chunk": chunk_id
                     }
                 ))
-        except Exception as e:
-            print(f"[❌] Erreur fichier {filename} : {e}")
+                chunk_id += 1
     return docs
 
 
-def build_vectorstore_from_files(
-    files: List[str],
-    index_folder: str,
-    embedding_type: EmbeddingType = EmbeddingType.LOCAL
-) -> FAISS:
-    print("[⚙️] Nettoyage et création de l’index...")
-    clean_index(index_folder)
+class TTLCache:
+    """Cache mémoire LRU borné en taille, dont les entrées expirent après ttl secondes."""
 
-    documents = load_documents(files)  # ⚡ Liste de fichiers directement
-    if not documents:
-        print(f"[⚠] Aucun document trouvé dans {files}")
-        return None
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    try:
-        if embedding_type == EmbeddingType.LOCAL:
-            from langchain_ollama import OllamaEmbeddings
-            embedding_model = OllamaEmbeddings(model="llama3.2:1b")
-        elif embedding_type == EmbeddingType.OPENAI:
-            embedding_model = OpenAIEmbeddings()
-        elif embedding_type == EmbeddingType.HUGGINGFACE:
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-            embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        else:
-            raise ValueError(f"Type non supporté : {embedding_type}")
-
-        vectorstore = FAISS.from_documents(documents, embedding_model)
-        vectorstore.save_local(index_folder)
-        print(f"[✅] Index sauvegardé dans {index_folder}")
-        return vectorstore
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
 
-    except Exception as e:
-        print(f"[❌] Échec indexation : {e}")
-        return None
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        """Entrées encore valides (copie)."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires, value) in self._entries.items() if expires >= now]
+
+
+def normalize_question(text: str) -> str:
+    text = unicodedata.normalize("NFC", text).lower()
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+# Cache à deux niveaux : embeddings des questions, puis réponses finales
+# (clé : question normalisée, langue, émotion, version de l'index).
+# ANSWER_CACHE_SIMILARITY > 0 active la réutilisation des réponses à des
+# questions quasi identiques (similarité cosinus des embeddings).
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+QUERY_EMBEDDING_CACHE_TTL = 24 * 3600
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL = 3600
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0))
+
+_query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+_answer_cache = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+_index_versions: "weakref.WeakKeyDictionary[FAISS, int]" = weakref.WeakKeyDictionary()
 
 
-def query_rag(question: str, vectorstore: FAISS, user_emotion: str = "neutre", k: int = 5, score_threshold: float = 0.7) -> str:
+class CachedBatchEmbeddings(Embeddings):
     """
-    user_emotion : émotion détectée (ex. "joyeux", "colère", "stressé", "fatigué", etc.)
+    Couche d'embedding au-dessus d'un backend LangChain (Ollama, HuggingFace...) :
+    les textes sont envoyés par lots de batch_size, jusqu'à concurrency lots en
+    parallèle, et les vecteurs sont mis en cache sur disque par (modèle, hash du texte).
+    Ré-indexer un corpus inchangé ne coûte donc que des lectures de cache.
     """
-    try:
-        user_lang = lang_detect(question)
-        print(f"[🌐] Langue détectée: {user_lang} | Émotion détectée: {user_emotion}")
-
-        docs_with_scores = vectorstore.similarity_search_with_score(question, k=k)
-        
-        relevant_docs = []
-        for doc, score in docs_with_scores:
-            doc_lang = doc.metadata.get("lang", "unknown")
-            if score > score_threshold and doc_lang == user_lang:
-                relevant_docs.append(doc)
-                print(f"[📄] Document sélectionné: {doc.metadata['source']} (score: {score:.2f}, langue: {doc_lang})")
-        
-        if not relevant_docs:
-            return f"Je n'ai pas trouvé d'informations pertinentes pour répondre à votre question. (Émotion détectée : {user_emotion})"
-        
-        context = "\n\n".join([doc.page_content for doc in relevant_docs])
 
-        # On ajoute l'émotion dans le prompt
-        if user_lang.startswith("en"):
-            prompt = f"""You are an expert assistant. 
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        cache_path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES
+    ):
+        self.base = base
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.cache = DiskLRUCache(cache_path, max_entries=max_entries)
+        self.last_stats: Dict[str, float] = {}
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        keys = [self._key(text) for text in texts]
+        vectors = {key: list(array("f", value)) for key, value in self.cache.get_many(keys).items()}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        missing_keys = list(missing)
+        batches = [
+            missing_keys[i:i + self.batch_size]
+            for i in range(0, len(missing_keys), self.batch_size)
+        ]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                results = pool.map(lambda batch: self.base.embed_documents([missing[k] for k in batch]), batches)
+                new_items = []
+                for batch, batch_vectors in zip(batches, results):
+                    for key, vector in zip(batch, batch_vectors):
+                        vectors[key] = vector
+                        new_items.append((key, array("f", vector).tobytes()))
+            self.cache.set_many(new_items)
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "texts": len(texts),
+            "cache_hits": len(texts) - sum(1 for key in keys if key in missing),
+            "embedded": len(missing_keys),
+            "seconds": elapsed,
+            "texts_per_s": len(texts) / elapsed if elapsed > 0 else 0.0
+        }
+        print(
+            f"[⚡] {len(texts)} texte(s) embarqué(s) en {elapsed:.2f}s "
+            f"({self.last_stats['texts_per_s']:.1f} textes/s, {self.last_stats['cache_hits']} depuis le cache)"
+        )
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeddings des questions, gardés en mémoire (les mêmes questions reviennent souvent)."""
+        key = (self.model_name, normalize_question(text))
+        vector = _query_embedding_cache.get(key)
+        if vector is None:
+            vector = self.base.embed_query(text)
+            _query_embedding_cache.put(key, vector)
+        return vector
+
+
+def get_embedding_model(embedding_type: EmbeddingType = EmbeddingType.LOCAL) -> CachedBatchEmbeddings:
+    if embedding_type == EmbeddingType.LOCAL:
+        from langchain_ollama import OllamaEmbeddings
+        model_name = "llama3.2:1b"
+        base = OllamaEmbeddings(model=model_name)
+    elif embedding_type == EmbeddingType.OPENAI:
+        base = OpenAIEmbeddings()
+        model_name = base.model
+    elif embedding_type == EmbeddingType.HUGGINGFACE:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        base = HuggingFaceEmbeddings(model_name=model_name)
+    else:
+        raise ValueError(f"Type non supporté : {embedding_type}")
+    return CachedBatchEmbeddings(base, model_name=f"{embedding_type}:{model_name}")
+
+
+def copy_vectorstore(store: FAISS) -> FAISS:
+    """Copie indépendante (index FAISS cloné, docstore et correspondances copiés)."""
+    return FAISS(
+        embedding_function=store.embedding_function,
+        index=faiss.clone_index(store.index),
+        docstore=InMemoryDocstore(dict(store.docstore._dict)),
+        index_to_docstore_id=dict(store.index_to_docstore_id),
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy
+    )
+
+
+def file_fingerprint(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _same_fingerprint(entry: Dict, fingerprint: Dict[str, int]) -> bool:
+    return entry.get("size") == fingerprint["size"] and entry.get("mtime_ns") == fingerprint["mtime_ns"]
+
+
+class IncrementalIndex:
+    """
+    Index FAISS mis à jour de façon incrémentale.
+    Un manifeste (manifest.json, à côté de l'index) associe chaque fichier
+    au hash de son contenu et aux ids de ses vecteurs : seuls les fichiers
+    nouveaux ou modifiés sont ré-embarqués, les fichiers disparus sont
+    supprimés de l'index.
+    """
+
+    def __init__(self, index_folder: str = INDEX_DIR, embedding_type: EmbeddingType = EmbeddingType.LOCAL):
+        self.index_folder = index_folder
+        self.embedding_type = embedding_type
+        self.vectorstore: Optional[FAISS] = None
+        self.manifest: Dict[str, Dict] = {"files": {}}
+        self._embedding_model = None
+        self._loaded = False
+        self._manifest_mtime = None
+        self._lock = threading.RLock()
+        self._lock_file = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.index_folder, MANIFEST_FILE)
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Verrou inter-processus (chaque worker uvicorn a son IncrementalIndex) :
+        un seul processus lit, met à jour ou écrit l'index à la fois. Le fichier
+        de verrou est à côté du dossier, que clean_index peut supprimer.
+        """
+        with self._lock:
+            if self._lock_file is not None:
+                yield  # déjà détenu par ce thread (load -> sync)
+                return
+            with open(self.index_folder.rstrip("/\\") + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_file = lock_file
+                try:
+                    # Un autre processus a pu modifier l'index depuis notre dernière lecture
+                    if self._loaded and self._disk_manifest_mtime() != self._manifest_mtime:
+                        self._loaded = False
+                    yield
+                finally:
+                    self._lock_file = None
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _disk_manifest_mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @property
+    def settings(self) -> Dict:
+        return {"embedding": self.embedding_type, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            self._embedding_model = get_embedding_model(self.embedding_type)
+        return self._embedding_model
+
+    def _load(self):
+        """Recharge l'index et le manifeste persistés (une seule fois)."""
+        if self._loaded:
+            return
+        self._loaded = True
+        self._manifest_mtime = self._disk_manifest_mtime()
+        self.manifest, self.vectorstore = {"files": {}}, None
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("settings") != self.settings:
+                print("[⚠] Index persistant créé avec d'autres paramètres (embedding / chunks), reconstruction complète.")
+                return
+            vectorstore = None
+            if any(entry["ids"] for entry in manifest.get("files", {}).values()):
+                vectorstore = FAISS.load_local(
+                    self.index_folder,
+                    self.embedding_model,
+                    allow_dangerous_deserialization=True
+                )
+            self.manifest, self.vectorstore = manifest, vectorstore
+            self._publish_version()
+        except Exception as e:
+            print(f"[⚠] Index persistant illisible, reconstruction complète : {e}")
+            self.manifest, self.vectorstore = {"files": {}}, None
+
+    def _publish_version(self):
+        """Associe la version du manifeste au vectorstore : les réponses en cache des versions précédentes deviennent invalides."""
+        if self.vectorstore is not None:
+            _index_versions[self.vectorstore] = self.manifest.get("version", 0)
+
+    def _save(self):
+        os.makedirs(self.index_folder, exist_ok=True)
+        if self.vectorstore is not None:
+            self.vectorstore.save_local(self.index_folder)
+        self._save_manifest()
+
+    def _save_manifest(self):
+        self.manifest["settings"] = self.settings
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = self._disk_manifest_mtime()
+
+    def is_stale(self, files: List[str]) -> bool:
+        """
+        Vérification rapide (sans hash) : l'index est obsolète si l'ensemble
+        des fichiers a changé ou si la taille / date de modification d'un
+        fichier diffère du manifeste.
+        """
+        entries = self.manifest["files"]
+        if set(files) != set(entries):
+            return True
+        for path in files:
+            try:
+                if not _same_fingerprint(entries[path], file_fingerprint(path)):
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def load(self, files: List[str]) -> Optional[FAISS]:
+        """
+        Démarrage rapide : charge l'index persistant avec FAISS.load_local et
+        ne passe par sync() (ré-embarquement incrémental) que s'il est obsolète.
+        """
+        with self._exclusive():
+            self._load()
+            if not self.is_stale(files):
+                print(f"[⚡] Index persistant à jour chargé depuis {self.index_folder} ({len(files)} fichier(s))")
+                return self.vectorstore
+            print("[⚙️] Index persistant obsolète, mise à jour incrémentale...")
+            return self.sync(files)
+
+    def sync(self, files: List[str]) -> Optional[FAISS]:
+        """
+        Aligne l'index sur la liste de fichiers donnée et retourne le vectorstore
+        (None si aucun document n'est indexé).
+        """
+        with self._exclusive():
+            self._load()
+            # Copie du manifeste : en cas d'échec, l'état publié reste cohérent
+            entries = dict(self.manifest["files"])
+
+            current, fingerprints = {}, {}
+            for path in files:
+                try:
+                    fingerprints[path] = file_fingerprint(path)
+                    entry = entries.get(path)
+                    if entry and _same_fingerprint(entry, fingerprints[path]):
+                        current[path] = entry["hash"]  # inchangé depuis la dernière indexation
+                    else:
+                        current[path] = file_hash(path)
+                except OSError as e:
+                    print(f"[❌] Erreur lecture {path} : {e}")
+
+            removed = [path for path in entries if path not in current]
+            changed = [path for path, digest in current.items() if entries.get(path, {}).get("hash") != digest]
+            if not removed and not changed:
+                # Fichiers touchés mais contenu identique : on rafraîchit juste les empreintes
+                touched = [path for path in current if not _same_fingerprint(entries[path], fingerprints[path])]
+                for path in touched:
+                    entries[path] = {**entries[path], **fingerprints[path]}
+                if touched:
+                    self.manifest["files"] = entries
+                    self._save_manifest()
+                print("[✅] Index à jour, aucun fichier à ré-embarquer.")
+                return self.vectorstore
+
+            print(f"[⚙️] Mise à jour incrémentale : {len(changed)} fichier(s) à indexer, {len(removed)} à retirer")
+
+            # Les recherches en cours utilisent self.vectorstore sans verrou : on
+            # modifie une copie, publiée d'un coup une fois complète
+            store = copy_vectorstore(self.vectorstore) if self.vectorstore is not None else None
+
+            for path in removed + changed:
+                entries.pop(path, None)
+            if store is not None:
+                # Ids retrouvés dans l'index plutôt que lus dans le manifeste : après un arrêt
+                # entre l'écriture de l'index et celle du manifeste, les deux ne concordent plus
+                prefixes = tuple(f"{path}::" for path in removed + changed)
+                stale_ids = [doc_id for doc_id in store.index_to_docstore_id.values() if doc_id.startswith(prefixes)]
+                if stale_ids:
+                    store.delete(stale_ids)
+
+            documents, ids = [], []
+            by_file: Dict[str, List[Document]] = {path: [] for path in changed}
+            for doc in load_documents(changed):
+                by_file.setdefault(doc.metadata["file_path"], []).append(doc)
+            for path, docs in by_file.items():
+                # Entrée même sans passage (PDF scanné, traduction vide) : le fichier n'est plus vu comme modifié
+                file_ids = [f"{path}::{i}" for i in range(len(docs))]
+                documents.extend(docs)
+                ids.extend(file_ids)
+                entries[path] = {"hash": current[path], "ids": file_ids, **fingerprints[path]}
+
+            if documents:
+                if store is None:
+                    store = FAISS.from_documents(documents, self.embedding_model, ids=ids)
+                else:
+                    store.add_documents(documents, ids=ids)
+
+            if not any(entry["ids"] for entry in entries.values()):
+                # Plus aucun passage indexé : on repart d'un index vide
+                clean_index(self.index_folder)
+                store = None
+
+            self.vectorstore = store
+            self.manifest["files"] = entries
+            self.manifest["version"] = self.manifest.get("version", 0) + 1
+            self._publish_version()
+            self._save()
+            print(f"[✅] Index incrémental sauvegardé dans {self.index_folder} ({len(entries)} fichier(s))")
+            return self.vectorstore
+
+
+_index_languages_cache: Dict[Tuple[int, int], Dict[str, int]] = {}
+
+def index_languages(vectorstore: FAISS) -> Dict[str, int]:
+    """Nombre de passages indexés par langue (mis en cache tant que l'index ne change pas)."""
+    key = (id(vectorstore), vectorstore.index.ntotal)
+    if key not in _index_languages_cache:
+        _index_languages_cache.clear()
+        counts: Dict[str, int] = {}
+        for doc in vectorstore.docstore._dict.values():
+            lang = doc.metadata.get("lang", "unknown")
+            counts[lang] = counts.get(lang, 0) + 1
+        _index_languages_cache[key] = dict(sorted(counts.items()))
+    return _index_languages_cache[key]
+
+
+def search_cross_lingual(question: str, user_lang: str, vectorstore: FAISS, k: int = 5) -> List[Tuple[Document, float]]:
+    """
+    Recherche dans chaque partition linguistique de l'index avec la question
+    traduite dans la langue de la partition, puis fusionne les résultats :
+    aucun passage n'est écarté parce qu'il n'est pas dans la langue de l'utilisateur.
+    """
+    from utils.translator import translate_text
+
+    languages = index_languages(vectorstore)
+    if list(languages) in ([user_lang], ["unknown"]):
+        return vectorstore.similarity_search_with_score(question, k=k)
+
+    total = vectorstore.index.ntotal
+    docs_with_scores = []
+    for doc_lang, count in languages.items():
+        query = question
+        if doc_lang not in (user_lang, "unknown"):
+            query = translate_text(question, src_lang=user_lang, tgt_lang=doc_lang) or question
+            print(f"[🌐] Question traduite pour les passages '{doc_lang}' : {query}")
+        # Le filtre s'applique après la recherche des fetch_k plus proches voisins :
+        # on en demande assez pour qu'une langue minoritaire y soit représentée
+        fetch_k = min(total, max(20, 4 * k * -(-total // count)))
+        docs_with_scores.extend(
+            vectorstore.similarity_search_with_score(query, k=k, filter={"lang": doc_lang}, fetch_k=fetch_k)
+        )
+    # Distances FAISS : les plus proches d'abord
+    docs_with_scores.sort(key=lambda item: item[1])
+    return docs_with_scores[:k]
+
+
+def build_rag_prompt(
+    question: str,
+    vectorstore: FAISS,
+    user_emotion: str = "neutre",
+    lang: Optional[str] = None,
+    k: int = 5,
+    score_threshold: Optional[float] = RAG_MAX_DISTANCE
+) -> Optional[str]:
+    """
+    Recherche les passages pertinents et construit le prompt du LLM.
+    lang : langue de la question déjà identifiée (Whisper) ; détectée sinon.
+    score_threshold : distance FAISS maximale d'un passage retenu (None : les k plus proches).
+    Retourne None si aucun passage pertinent n'a été trouvé.
+    """
+    user_lang = lang or lang_detect(question)
+    print(f"[🌐] Langue de la question: {user_lang} | Émotion détectée: {user_emotion}")
+
+    docs_with_scores = search_cross_lingual(question, user_lang, vectorstore, k=k)
+    
+    relevant_docs = []
+    for doc, score in docs_with_scores:
+        doc_lang = doc.metadata.get("lang", "unknown")
+        if score_threshold is None or score <= score_threshold:
+            relevant_docs.append(doc)
+            page = doc.metadata.get("page")
+            location = f", page {page}" if page else ""
+            print(f"[📄] Passage sélectionné: {doc.metadata['source']}{location} (score: {score:.2f}, langue: {doc_lang})")
+    
+    if not relevant_docs:
+        return None
+    
+    context = "\n\n".join([doc.page_content for doc in relevant_docs])
+
+    # On ajoute l'émotion dans le prompt
+    if user_lang.startswith("en"):
+        prompt = f"""You are an expert assistant. 
 The user is currently feeling: {user_emotion}.
 Answer the question considering the user's emotional state, while using ONLY the context below.
 If you don't know the answer, say you don't know. Be precise and factual.
@@ -140,8 +619,8 @@ Question:
 {question}
 
 Answer:"""
-        elif user_lang.startswith("ar"):
-            prompt = f"""أنت مساعد خبير. 
+    elif user_lang.startswith("ar"):
+        prompt = f"""أنت مساعد خبير. 
 المستخدم حالياً يشعر بـ: {user_emotion}.
 أجب على السؤال مع مراعاة الحالة العاطفية للمستخدم، باستخدام السياق أدناه فقط.
 إذا كنت لا تعرف الإجابة، فقل أنك لا تعرف. كن دقيقًا وواقعيًا.
@@ -153,8 +632,8 @@ Answer:"""
 {question}
 
 الإجابة:"""
-        else:
-            prompt = f"""Tu es un assistant expert. 
+    else:
+        prompt = f"""Tu es un assistant expert. 
 L'utilisateur se sent actuellement : {user_emotion}.
 Réponds à la question en tenant compte de son état émotionnel, en utilisant UNIQUEMENT le contexte ci-dessous.
 Si tu ne connais pas la réponse, dis que tu ne sais pas. Sois précis et factuel.
@@ -167,8 +646,142 @@ Question:
 
 Réponse:"""
 
-        answer = llm.invoke(prompt)
-        return answer.strip()
+    return prompt
+
+
+def _answer_key(question: str, vectorstore: FAISS, user_emotion: str, lang: str):
+    return (normalize_question(question), lang, user_emotion, _index_versions.get(vectorstore, 0))
+
+
+def lookup_answer(question: str, vectorstore: FAISS, user_emotion: str = "neutre", lang: Optional[str] = None) -> Optional[str]:
+    """Réponse en cache pour cette question (ou une question quasi identique), sinon None."""
+    key = _answer_key(question, vectorstore, user_emotion, lang or lang_detect(question))
+    cached = _answer_cache.get(key)
+    if cached is not None:
+        print("[⚡] Réponse servie depuis le cache")
+        return cached[0]
+
+    if ANSWER_CACHE_SIMILARITY > 0:
+        query = np.asarray(vectorstore.embedding_function.embed_query(question), dtype=np.float32)
+        best, best_score = None, ANSWER_CACHE_SIMILARITY
+        for other_key, (answer, vector) in _answer_cache.items():
+            if other_key[1:] != key[1:] or vector is None:
+                continue
+            score = float(np.dot(query, vector) / (np.linalg.norm(query) * np.linalg.norm(vector) + 1e-12))
+            if score >= best_score:
+                best, best_score = answer, score
+        if best is not None:
+            print(f"[⚡] Réponse servie depuis le cache (question similaire, cosinus {best_score:.3f})")
+            return best
+    return None
+
+
+def remember_answer(question: str, vectorstore: FAISS, answer: str, user_emotion: str = "neutre", lang: Optional[str] = None):
+    key = _answer_key(question, vectorstore, user_emotion, lang or lang_detect(question))
+    vector = None
+    if ANSWER_CACHE_SIMILARITY > 0:
+        vector = np.asarray(vectorstore.embedding_function.embed_query(question), dtype=np.float32)
+    _answer_cache.put(key, (answer, vector))
+
+
+def query_rag(
+    question: str,
+    vectorstore: FAISS,
+    user_emotion: str = "neutre",
+    lang: Optional[str] = None,
+    k: int = 5,
+    score_threshold: Optional[float] = RAG_MAX_DISTANCE
+) -> str:
+    """
+    user_emotion : émotion détectée (ex. "joyeux", "colère", "stressé", "fatigué", etc.)
+    lang : langue de la question identifiée par Whisper (évite une nouvelle détection)
+    """
+    try:
+        lang = lang or lang_detect(question)
+        cached = lookup_answer(question, vectorstore, user_emotion, lang=lang)
+        if cached is not None:
+            return cached
+
+        prompt = build_rag_prompt(question, vectorstore, user_emotion, lang=lang, k=k, score_threshold=score_threshold)
+        if prompt is None:
+            return f"Je n'ai pas trouvé d'informations pertinentes pour répondre à votre question. (Émotion détectée : {user_emotion})"
+
+        answer = get_llm().invoke(prompt).strip()
+        remember_answer(question, vectorstore, answer, user_emotion, lang=lang)
+        return answer
 
     except Exception as e:
         return f"❌ Erreur RAG : {e}"
+
+
+def query_rag_structured(
+    question: str,
+    vectorstore: FAISS,
+    user_emotion: str = "neutre",
+    lang: Optional[str] = None,
+    k: int = 5,
+    score_threshold: Optional[float] = RAG_MAX_DISTANCE
+) -> Tuple[str, Optional[dict]]:
+    """
+    Variante de query_rag où une seule génération contrainte (schéma JSON)
+    produit la réponse et ses émotions/actions : plus de second appel au LLM.
+    Retourne (réponse, émotions_actions) ; émotions_actions vaut None quand
+    elles restent à extraire (réponse en cache, pas de passage pertinent,
+    sortie JSON invalide).
+    """
+    try:
+        lang = lang or lang_detect(question)
+        cached = lookup_answer(question, vectorstore, user_emotion, lang=lang)
+        if cached is not None:
+            return cached, None
+
+        prompt = build_rag_prompt(question, vectorstore, user_emotion, lang=lang, k=k, score_threshold=score_threshold)
+        if prompt is None:
+            return f"Je n'ai pas trouvé d'informations pertinentes pour répondre à votre question. (Émotion détectée : {user_emotion})", None
+
+        try:
+            data = generate_json(prompt + joint_instructions(lang), schema=joint_schema(lang))
+            answer = str(data.get("answer", "")).strip()
+        except (OllamaError, AttributeError) as e:
+            print(f"[⚠] Génération structurée impossible, réponse simple : {e}")
+            data, answer = None, ""
+        if not answer:
+            answer = get_llm().invoke(prompt).strip()
+            remember_answer(question, vectorstore, answer, user_emotion, lang=lang)
+            return answer, None
+
+        emotions_actions = normalize_extraction(data, lang)
+        record_extraction(emotions_actions, lang, source="joint")
+        remember_answer(question, vectorstore, answer, user_emotion, lang=lang)
+        return answer, emotions_actions
+
+    except Exception as e:
+        return f"❌ Erreur RAG : {e}", None
+
+
+# Fin de phrase : ponctuation finale suivie d'un espace, ou paragraphe
+SENTENCE_END = re.compile(r"[.!?؟…]+[\"»)\]]*\s+|\n{2,}")
+
+def iter_sentences(tokens: Iterable[str], min_chars: int = 20) -> Iterator[str]:
+    """
+    Regroupe un flux de tokens en phrases complètes, émises dès que leur
+    ponctuation finale arrive (les fragments trop courts sont fusionnés
+    avec la phrase suivante).
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        start = 0
+        for match in SENTENCE_END.finditer(buffer):
+            sentence = buffer[start:match.end()].strip()
+            if len(sentence) >= min_chars:
+                yield sentence
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def stream_answer_sentences(prompt: str) -> Iterator[str]:
+    """Génère la réponse du LLM en streaming (API Ollama), phrase par phrase."""
+    return iter_sentences(get_llm().stream(prompt))
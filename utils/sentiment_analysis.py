@@ -2,11 +2,11 @@
 import os
 import torch
 import numpy as np
-from transformers import pipeline
-from pydub import AudioSegment
-import tempfile
 import logging
 
+from utils.audio_frontend import prepare_audio, SAMPLE_RATE
+from utils.model_lifecycle import models
+
 # Configuration des logs
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
@@ -18,14 +18,20 @@ logging.getLogger("pydub").setLevel(logging.ERROR)
 # Modèle Hugging Face pour l'analyse d'émotions
 MODEL_NAME = "audeering/wav2vec2-large-robust-12-ft-emotion-msp-dim"
 
-# Charger le modèle une seule fois
-if 'classifier' not in globals():
-    classifier = pipeline(
+def _load_classifier():
+    from transformers import pipeline
+    return pipeline(
         "audio-classification", 
         model=MODEL_NAME,
         device=0 if torch.cuda.is_available() else -1
     )
 
+# Charger le modèle une seule fois, en arrière-plan au démarrage
+models.register("emotion", _load_classifier)
+
+def get_classifier():
+    return models.get("emotion")
+
 # Mapping des émotions
 EMOTION_MAPPING = {
     "anger": "Colère / Frustration",
@@ -44,46 +50,67 @@ DIMENSION_MAPPING = {
     2: "Dominance (Soumis/Contrôlant)"
 }
 
-def convert_to_wav(input_path):
-    """Convertit n'importe quel format audio en WAV 16kHz mono"""
-    try:
-        audio = AudioSegment.from_file(input_path)
-        audio = audio.set_frame_rate(16000).set_channels(1)
-        
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            audio.export(tmp.name, format="wav")
-            return tmp.name
-    except Exception as e:
-        logger.error(f"Erreur de conversion audio: {str(e)}")
-        return None
+# Libellés du modèle correspondant à chaque dimension de DIMENSION_MAPPING
+DIMENSION_LABELS = {
+    0: ("valence",),
+    1: ("arousal", "activation"),
+    2: ("dominance",)
+}
+
+def _forward(audio):
+    """Une seule passe du modèle wav2vec2 : retourne les logits de la tête."""
+    classifier = get_classifier()
+    inputs = classifier.feature_extractor(audio, sampling_rate=SAMPLE_RATE, return_tensors="pt")
+    inputs = {name: tensor.to(classifier.device) for name, tensor in inputs.items()}
+    with torch.inference_mode():
+        logits = classifier.model(**inputs).logits[0]
+    return logits.float().cpu()
+
+def _dimensions_from_logits(logits):
+    """Valeurs valence / activation / dominance, dans l'ordre de DIMENSION_MAPPING."""
+    labels = {i: str(label).lower() for i, label in get_classifier().model.config.id2label.items()}
+    dimensions = []
+    for dim in sorted(DIMENSION_MAPPING):
+        index = next(
+            (i for i, label in labels.items() if any(name in label for name in DIMENSION_LABELS[dim])),
+            None
+        )
+        if index is None:
+            # Libellés inconnus : on garde l'ordre brut de la tête
+            return [float(value) for value in logits]
+        dimensions.append(float(logits[index]))
+    return dimensions
+
+def predict_emotion(audio, with_dimensions: bool = True):
+    """
+    Analyse l'émotion dans un fichier audio, ou dans un signal déjà préparé
+    par utils.audio_frontend.prepare_audio (mono float32 16 kHz, silences retirés).
+    Une seule inférence fournit l'émotion, sa confiance et, si with_dimensions,
+    les dimensions valence / activation / dominance.
+    """
+    if isinstance(audio, str):
+        if not os.path.exists(audio):
+            raise FileNotFoundError(f"Fichier audio introuvable : {audio}")
+        try:
+            audio = prepare_audio(audio)
+        except Exception as e:
+            logger.error(f"Erreur de conversion audio: {str(e)}")
+            return "error", 0.0, None
+    if len(audio) == 0:
+        return "error", 0.0, None
 
-def predict_emotion(file_path):
-    """Analyse l'émotion dans un fichier audio"""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Fichier audio introuvable : {file_path}")
-    
     try:
-        # Conversion si nécessaire
-        if not file_path.lower().endswith('.wav'):
-            file_path = convert_to_wav(file_path)
-            if not file_path:
-                return "error", 0.0, None
-        
-        # Analyse de l'émotion
-        results = classifier(file_path, top_k=3)
-        
-        # Récupération de l'émotion principale
-        main_emotion = results[0]['label']
-        confidence = results[0]['score']
-        
-        # Analyse dimensionnelle
-        dimensional_results = classifier(
-            file_path, 
-            return_dimensional=True, 
-            top_k=None
-        )[0]
-        
-        return main_emotion, confidence, dimensional_results
+        logits = _forward(audio)
+
+        # Émotion principale
+        probabilities = torch.softmax(logits, dim=-1)
+        confidence, index = probabilities.max(dim=-1)
+        main_emotion = get_classifier().model.config.id2label[int(index)]
+
+        # Analyse dimensionnelle, à partir des mêmes logits
+        dimensional_results = _dimensions_from_logits(logits) if with_dimensions else None
+
+        return main_emotion, float(confidence), dimensional_results
     except Exception as e:
         logger.error(f"Erreur d'analyse: {str(e)}")
         return "error", 0.0, None
@@ -0,0 +1,126 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import docx
+
+from utils.disk_cache import DiskLRUCache
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+
+# Texte extrait par (hash du fichier, page) : traduction et indexation d'un
+# même fichier ne l'analysent qu'une fois
+TEXT_CACHE_PATH = os.path.join("cache", "extracted_text.sqlite")
+TEXT_CACHE_MAX_ENTRIES = 100_000
+EXTRACTOR_VERSION = "1"
+
+# Les PDF d'au moins PARALLEL_PDF_MIN_PAGES pages sont analysés par plages
+# de pages dans un pool de processus
+PARALLEL_PDF_MIN_PAGES = 32
+PDF_PAGES_PER_TASK = 16
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> DiskLRUCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(TEXT_CACHE_PATH, TEXT_CACHE_MAX_ENTRIES)
+        return _cache
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 du contenu d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _page_key(digest: str, page) -> str:
+    return f"{EXTRACTOR_VERSION}:{digest}:{page}"
+
+
+def _pdf_page_range(path: str, start: int, end: int) -> List[str]:
+    """Texte des pages [start, end) (exécuté dans un processus du pool)."""
+    with fitz.open(path) as pdf:
+        return [pdf[number].get_text() for number in range(start, end)]
+
+
+def _iter_pdf_pages(path: str, page_count: int, workers: int) -> Iterator[str]:
+    if workers <= 1 or page_count < PARALLEL_PDF_MIN_PAGES:
+        with fitz.open(path) as pdf:
+            for page in pdf:
+                yield page.get_text()
+        return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # map conserve l'ordre : les pages sont émises dès que leur plage est prête
+        for texts in executor.map(_pdf_page_range, [path] * len(ranges), *zip(*ranges)):
+            yield from texts
+
+
+def _parse_pages(path: str, ext: str, workers: int) -> Iterator[Tuple[Optional[int], str]]:
+    if ext == ".pdf":
+        with fitz.open(path) as pdf:
+            page_count = pdf.page_count
+        for number, text in enumerate(_iter_pdf_pages(path, page_count, workers), start=1):
+            yield number, text
+    elif ext == ".docx":
+        document = docx.Document(path)
+        # Paragraphes séparés par une ligne vide : le découpage en chunks et en segments respecte leurs frontières
+        yield None, "\n\n".join(para.text for para in document.paragraphs if para.text.strip())
+
+
+def iter_pages(path: str, workers: Optional[int] = None) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Sections naturelles d'un fichier, en flux : (numéro de page, texte) pour
+    chaque page d'un PDF, une seule section (None, texte) pour DOCX et TXT.
+    PDF et DOCX passent par le cache de texte extrait.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Format non supporté : {os.path.basename(path)}")
+    if ext == ".txt":
+        with open(path, "r", encoding="utf-8") as f:
+            yield None, f.read()
+        return
+
+    cache = get_text_cache()
+    digest = file_hash(path)
+    count_key = _page_key(digest, "pages")
+    cached_count = cache.get(count_key)
+    if cached_count is not None:
+        pages = [None] if ext == ".docx" else list(range(1, int(cached_count) + 1))
+        keys = [_page_key(digest, page) for page in pages]
+        found = cache.get_many(keys)
+        if len(found) == len(keys):
+            for page, key in zip(pages, keys):
+                yield page, found[key].decode("utf-8")
+            return
+
+    count = 0
+    batch = []
+    for page, text in _parse_pages(path, ext, workers or EXTRACTION_WORKERS):
+        count += 1
+        batch.append((_page_key(digest, page), text.encode("utf-8")))
+        if len(batch) >= PDF_PAGES_PER_TASK:
+            cache.set_many(batch)
+            batch = []
+        yield page, text
+    # Nombre de pages enregistré en dernier : le cache n'est utilisé que complet
+    cache.set_many(batch + [(count_key, str(count).encode())])
+
+
+def extract_text(path: str, workers: Optional[int] = None) -> str:
+    """Texte complet du fichier (pages jointes en une seule passe)."""
+    return "".join(text for _, text in iter_pages(path, workers))
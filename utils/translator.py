@@ -1,24 +1,172 @@
 import os
+import re
+import time
+import hashlib
+import unicodedata
 import logging
-from typing import List, Optional
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+import torch
 from transformers import MarianMTModel, MarianTokenizer
-import docx
-import fitz  # PyMuPDF
 from langdetect import detect, LangDetectException
 
+from utils.disk_cache import DiskLRUCache
+from utils.model_lifecycle import models
+from utils.text_extraction import extract_text
+
 logging.basicConfig(level=logging.INFO)
-_loaded_models = {}
+
+# Moteur de traduction par lots (0 = valeur par défaut du modèle / de torch)
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", 8))
+TRANSLATION_NUM_BEAMS = int(os.getenv("TRANSLATION_NUM_BEAMS", 0))
+TRANSLATION_THREADS = int(os.getenv("TRANSLATION_THREADS", 0))
+
+# Traduction parallèle des documents : nombre de processus (chacun charge ses
+# propres modèles Marian, donc borne la mémoire) et taille des lots de chunks
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", 1))
+PARALLEL_PART_CHUNKS = 32
+
+if TRANSLATION_THREADS > 0:
+    torch.set_num_threads(TRANSLATION_THREADS)
+
+# Mémoire de traduction : (src, tgt, phrase normalisée) -> traduction
+TRANSLATION_MEMORY_PATH = os.path.join("cache", "translation_memory.sqlite")
+TRANSLATION_MEMORY_MAX_ENTRIES = 200_000
+_translation_memory = None
+
+# Débit cumulé du moteur de traduction
+translation_stats = {"chunks": 0, "seconds": 0.0, "memory_hits": 0}
+
+# Registre des modèles : paires préchargées au démarrage, budget mémoire,
+# langue pivot pour les paires sans modèle direct
+TRANSLATION_LANGS = ("fr", "en", "ar")
+TRANSLATION_PAIRS = [(src, tgt) for src in TRANSLATION_LANGS for tgt in TRANSLATION_LANGS if src != tgt]
+TRANSLATION_MEMORY_BUDGET_MB = int(os.getenv("TRANSLATION_MEMORY_BUDGET_MB", 2048))
+PIVOT_LANG = "en"
+WARMUP_TEXTS = {"fr": "Bonjour.", "en": "Hello.", "ar": "مرحبا."}
+# Un échec de chargement (modèle inexistant, mais aussi Hub ou réseau
+# momentanément injoignable) n'est mémorisé que pour cette durée
+MISSING_MODEL_RETRY_SECONDS = float(os.getenv("MISSING_MODEL_RETRY_SECONDS", 300))
+
+class ModelRegistry:
+    """
+    Registre des modèles Marian : chaque modèle n'est chargé qu'une fois
+    (verrou par modèle), les modèles les moins récemment utilisés sont
+    déchargés au-delà du budget mémoire, et les paires sans modèle direct
+    opus-mt-{src}-{tgt} passent par l'anglais.
+    """
+
+    def __init__(self, memory_budget_mb: int = TRANSLATION_MEMORY_BUDGET_MB):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._models: "OrderedDict[str, Dict]" = OrderedDict()
+        self._missing: Dict[str, float] = {}  # nom -> date de l'échec de chargement
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def model_name(src_lang: str, tgt_lang: str) -> str:
+        return f"Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}"
+
+    def _cached(self, name: str):
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None:
+                return None
+            self._models.move_to_end(name)
+            return entry["tokenizer"], entry["model"]
+
+    def get(self, src_lang: str, tgt_lang: str):
+        name = self.model_name(src_lang, tgt_lang)
+        cached = self._cached(name)
+        if cached:
+            return cached
+
+        with self._lock:
+            load_lock = self._loading.setdefault(name, threading.Lock())
+        with load_lock:
+            # Un autre thread a pu le charger pendant l'attente
+            cached = self._cached(name)
+            if cached:
+                return cached
+            failed_at = self._missing.get(name)
+            if failed_at is not None and time.monotonic() - failed_at < MISSING_MODEL_RETRY_SECONDS:
+                raise OSError(f"Modèle indisponible : {name}")
+
+            logging.info(f"Chargement modèle {name}")
+            try:
+                tokenizer = MarianTokenizer.from_pretrained(name)
+                model = MarianMTModel.from_pretrained(name)
+            except OSError:
+                self._missing[name] = time.monotonic()
+                raise
+            self._missing.pop(name, None)
+            model.eval()
+            size = sum(p.numel() * p.element_size() for p in model.parameters())
+
+            with self._lock:
+                self._models[name] = {"tokenizer": tokenizer, "model": model, "bytes": size}
+                self._evict(keep=name)
+            return tokenizer, model
+
+    def _evict(self, keep: str):
+        total = sum(entry["bytes"] for entry in self._models.values())
+        for name in list(self._models):
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            total -= self._models.pop(name)["bytes"]
+            logging.info(f"Modèle déchargé (budget mémoire) : {name}")
+
+    def available(self, src_lang: str, tgt_lang: str) -> bool:
+        try:
+            self.get(src_lang, tgt_lang)
+            return True
+        except OSError:
+            return False
+
+    def route(self, src_lang: str, tgt_lang: str) -> List[Tuple[str, str]]:
+        """Étapes de traduction : modèle direct si disponible, sinon pivot par l'anglais."""
+        if src_lang == tgt_lang:
+            return []
+        if self.available(src_lang, tgt_lang):
+            return [(src_lang, tgt_lang)]
+        if PIVOT_LANG not in (src_lang, tgt_lang) \
+                and self.available(src_lang, PIVOT_LANG) and self.available(PIVOT_LANG, tgt_lang):
+            logging.info(f"Pas de modèle direct {src_lang} -> {tgt_lang}, pivot par {PIVOT_LANG}")
+            return [(src_lang, PIVOT_LANG), (PIVOT_LANG, tgt_lang)]
+        raise OSError(f"Aucun modèle de traduction pour {src_lang} -> {tgt_lang}")
+
+    def preload(self, pairs: List[Tuple[str, str]]):
+        """Charge les modèles des paires données et fait une inférence de chauffe."""
+        for src_lang, tgt_lang in pairs:
+            try:
+                for hop_src, hop_tgt in self.route(src_lang, tgt_lang):
+                    tokenizer, model = self.get(hop_src, hop_tgt)
+                    translate_batch([WARMUP_TEXTS.get(hop_src, "Hello.")], tokenizer, model)
+            except Exception as e:
+                logging.error(f"Préchargement {src_lang} -> {tgt_lang} impossible : {e}")
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+
+_registry = ModelRegistry()
 
 def load_model(src_lang: str, tgt_lang: str):
-    model_name = f"Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}"
-    if model_name in _loaded_models:
-        return _loaded_models[model_name]["tokenizer"], _loaded_models[model_name]["model"]
-    
-    logging.info(f"Chargement modèle {model_name}")
-    tokenizer = MarianTokenizer.from_pretrained(model_name)
-    model = MarianMTModel.from_pretrained(model_name)
-    _loaded_models[model_name] = {"tokenizer": tokenizer, "model": model}
-    return tokenizer, model
+    return _registry.get(src_lang, tgt_lang)
+
+def preload_translation_models(pairs: Optional[List[Tuple[str, str]]] = None):
+    _registry.preload(pairs if pairs is not None else TRANSLATION_PAIRS)
+    return _registry
+
+# Préchargement des paires configurées en arrière-plan ; non bloquant pour la
+# disponibilité du serveur (les autres paires se chargent à la demande)
+models.register("translation", preload_translation_models, required=False)
 
 def detect_language(text: str) -> str:
     try:
@@ -29,13 +177,26 @@ def detect_language(text: str) -> str:
         logging.warning("Langue non détectée, utilisation 'en' par défaut")
         return "en"
 
-def split_text(text: str, max_len: int = 500) -> List[str]:
+# Frontières de phrase : ponctuation finale suivie d'un espace ; les lignes
+# vides séparent les paragraphes, les simples retours à la ligne (césures
+# des PDF) sont traités comme des espaces
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?؟…])\s+")
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for paragraph in PARAGRAPH_BOUNDARY.split(text):
+        paragraph = " ".join(paragraph.split())
+        sentences.extend(s for s in SENTENCE_BOUNDARY.split(paragraph) if s)
+    return sentences
+
+def _split_words(text: str, max_len: int) -> List[str]:
     words = text.split()
     chunks = []
     current_chunk = []
     current_len = 0
     for word in words:
-        if current_len + len(word) + 1 > max_len:
+        if current_chunk and current_len + len(word) + 1 > max_len:
             chunks.append(" ".join(current_chunk))
             current_chunk = [word]
             current_len = len(word) + 1
@@ -46,75 +207,245 @@ def split_text(text: str, max_len: int = 500) -> List[str]:
         chunks.append(" ".join(current_chunk))
     return chunks
 
+def split_text(text: str, max_len: int = 500) -> List[str]:
+    """
+    Découpe le texte en phrases (unité de traduction et de la mémoire de
+    traduction) ; seules les phrases plus longues que max_len sont coupées
+    sur les mots.
+    """
+    chunks = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_len:
+            chunks.append(sentence)
+        else:
+            chunks.extend(_split_words(sentence, max_len))
+    return chunks
+
+def get_translation_memory() -> DiskLRUCache:
+    """Mémoire de traduction persistante, ouverte une fois par processus."""
+    global _translation_memory
+    if _translation_memory is None:
+        _translation_memory = DiskLRUCache(TRANSLATION_MEMORY_PATH, max_entries=TRANSLATION_MEMORY_MAX_ENTRIES)
+    return _translation_memory
+
+def normalize_segment(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def _memory_key(src_lang: str, tgt_lang: str, segment: str) -> str:
+    return hashlib.sha256(f"{src_lang}|{tgt_lang}|{segment}".encode("utf-8")).hexdigest()
+
+def translate_segments(segments: List[str], src_lang: str, tgt_lang: str) -> List[str]:
+    """
+    Traduit des segments en passant d'abord par la mémoire de traduction :
+    seuls les segments jamais vus (normalisés) passent par model.generate.
+    """
+    normalized = [normalize_segment(segment) for segment in segments]
+    keys = [_memory_key(src_lang, tgt_lang, segment) for segment in normalized]
+    memory = get_translation_memory()
+    translations = {key: value.decode("utf-8") for key, value in memory.get_many(keys).items()}
+
+    misses = {}
+    for key, segment in zip(keys, normalized):
+        if key not in translations and segment:
+            misses.setdefault(key, segment)
+    translation_stats["memory_hits"] += len(segments) - len(misses)
+
+    if misses:
+        outputs = list(misses.values())
+        for hop_src, hop_tgt in _registry.route(src_lang, tgt_lang):
+            tokenizer, model = _registry.get(hop_src, hop_tgt)
+            outputs = translate_batch(outputs, tokenizer, model)
+        translations.update(zip(misses, outputs))
+        memory.set_many([(key, translations[key].encode("utf-8")) for key in misses])
+
+    return [translations.get(key, "") for key in keys]
+
 def translate_text(text: str, src_lang: str, tgt_lang: str) -> str:
     if src_lang == "auto":
         src_lang = detect_language(text)
-    
+
+    chunks = split_text(text, max_len=500)
     try:
-        tokenizer, model = load_model(src_lang, tgt_lang)
+        return " ".join(translate_segments(chunks, src_lang, tgt_lang))
     except Exception as e:
-        logging.error(f"Erreur chargement modèle pour {src_lang} -> {tgt_lang} : {e}")
+        logging.error(f"Erreur traduction {src_lang} -> {tgt_lang} : {e}")
         return ""
 
-    chunks = split_text(text, max_len=500)
-    results = []
+def translate_batch(
+    chunks: List[str],
+    tokenizer: MarianTokenizer,
+    model: MarianMTModel,
+    batch_size: int = TRANSLATION_BATCH_SIZE,
+    num_beams: int = TRANSLATION_NUM_BEAMS
+) -> List[str]:
+    """
+    Traduit une liste de chunks par lots : les chunks sont triés par longueur
+    pour limiter le padding, générés sous torch.inference_mode(), puis remis
+    dans leur ordre d'origine.
+    """
+    if not chunks:
+        return []
+
+    start = time.perf_counter()
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]), reverse=True)
+    results = [""] * len(chunks)
+    generate_kwargs = {"num_beams": num_beams} if num_beams > 0 else {}
 
-    for chunk in chunks:
-        tokens = tokenizer(chunk, return_tensors="pt", padding=True, truncation=True)
-        translated = model.generate(**tokens)
-        result = tokenizer.decode(translated[0], skip_special_tokens=True)
-        results.append(result.strip())
+    with torch.inference_mode():
+        for offset in range(0, len(order), batch_size):
+            indices = order[offset:offset + batch_size]
+            tokens = tokenizer([chunks[i] for i in indices], return_tensors="pt", padding=True, truncation=True)
+            translated = model.generate(**tokens, **generate_kwargs)
+            for i, result in zip(indices, tokenizer.batch_decode(translated, skip_special_tokens=True)):
+                results[i] = result.strip()
 
-    return " ".join(results)
+    elapsed = time.perf_counter() - start
+    translation_stats["chunks"] += len(chunks)
+    translation_stats["seconds"] += elapsed
+    logging.info(f"{len(chunks)} chunk(s) traduit(s) en {elapsed:.2f}s ({len(chunks) / elapsed:.1f} chunks/s)")
+    return results
+
+def get_translation_stats() -> Dict[str, float]:
+    seconds = translation_stats["seconds"]
+    return {
+        **translation_stats,
+        "chunks_per_s": translation_stats["chunks"] / seconds if seconds > 0 else 0.0
+    }
 
 def extract_text_from_file(file_path: str) -> str:
-    ext = os.path.splitext(file_path)[1].lower()
-
-    if ext == ".txt":
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    elif ext == ".docx":
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
-    elif ext == ".pdf":
-        text = ""
-        with fitz.open(file_path) as pdf:
-            for page in pdf:
-                text += page.get_text()
-        return text
-    else:
-        raise ValueError(f"Format non supporté : {ext}")
+    # Extraction partagée avec l'indexation (cache par page, PDF en parallèle)
+    return extract_text(file_path)
+
+def _write_translation(file_path: str, tgt_lang: str, output_dir: str, translated_text: str) -> str:
+    filename = os.path.basename(file_path)
+    out_name = os.path.splitext(filename)[0] + f"_translated_{tgt_lang}.txt"
+    out_path = os.path.join(output_dir, out_name)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(translated_text)
+
+    logging.info(f"Fichier traduit sauvegardé : {out_path}")
+    return out_path
 
 def translate_documents(
     file_paths: List[str],
     src_lang: str,
     tgt_lang: str,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int, str], None]] = None
 ) -> List[str]:
+    """
+    Traduit des fichiers vers tgt_lang. Avec workers > 1 (TRANSLATION_WORKERS
+    par défaut), les fichiers et les lots de chunks des gros fichiers sont
+    répartis sur un pool de processus. progress_callback(fait, total, chemin)
+    est appelé à chaque fichier terminé.
+    """
     if output_dir is None:
         output_dir = "translated_docs"
     os.makedirs(output_dir, exist_ok=True)
 
+    if workers is None:
+        workers = TRANSLATION_WORKERS
+    if workers > 1 and file_paths:
+        return _translate_documents_parallel(file_paths, src_lang, tgt_lang, output_dir, workers, progress_callback)
+
     translated_paths = []
 
-    for file_path in file_paths:
+    for done, file_path in enumerate(file_paths, start=1):
         try:
             original_text = extract_text_from_file(file_path)
             if not original_text.strip():
                 logging.warning(f"Fichier {file_path} vide, ignoré.")
                 continue
             translated_text = translate_text(original_text, src_lang, tgt_lang)
+            translated_paths.append(_write_translation(file_path, tgt_lang, output_dir, translated_text))
+        except Exception as e:
+            logging.error(f"Erreur traduction {file_path} : {e}")
+        finally:
+            if progress_callback:
+                progress_callback(done, len(file_paths), file_path)
 
-            filename = os.path.basename(file_path)
-            out_name = os.path.splitext(filename)[0] + f"_translated_{tgt_lang}.txt"
-            out_path = os.path.join(output_dir, out_name)
+    return translated_paths
 
-            with open(out_path, "w", encoding="utf-8") as f:
-                f.write(translated_text)
+def _init_translation_worker(threads: int):
+    torch.set_num_threads(threads)
 
-            logging.info(f"Fichier traduit sauvegardé : {out_path}")
-            translated_paths.append(out_path)
+def _translate_part(chunks: List[str], src_lang: str, tgt_lang: str) -> Tuple[List[str], Dict[str, float]]:
+    """
+    Exécuté dans un processus du pool : chaque processus charge ses propres
+    modèles Marian. Retourne aussi l'évolution des compteurs du processus,
+    reportée dans ceux du processus principal.
+    """
+    before = dict(translation_stats)
+    translations = translate_segments(chunks, src_lang, tgt_lang)
+    return translations, {key: translation_stats[key] - before[key] for key in before}
+
+def _translate_documents_parallel(
+    file_paths: List[str],
+    src_lang: str,
+    tgt_lang: str,
+    output_dir: str,
+    workers: int,
+    progress_callback: Optional[Callable[[int, int, str], None]]
+) -> List[str]:
+    # Extraction et découpage dans le processus principal
+    jobs = []
+    for file_path in file_paths:
+        try:
+            original_text = extract_text_from_file(file_path)
         except Exception as e:
             logging.error(f"Erreur traduction {file_path} : {e}")
+            continue
+        if not original_text.strip():
+            logging.warning(f"Fichier {file_path} vide, ignoré.")
+            continue
+        file_src = detect_language(original_text) if src_lang == "auto" else src_lang
+        chunks = split_text(original_text, max_len=500)
+        parts = [chunks[i:i + PARALLEL_PART_CHUNKS] for i in range(0, len(chunks), PARALLEL_PART_CHUNKS)]
+        jobs.append((file_path, file_src, parts))
 
-    return translated_paths
+    total = len(file_paths)
+    done = total - len(jobs)
+    results = {file_path: [None] * len(parts) for file_path, _, parts in jobs}
+    remaining = {file_path: len(parts) for file_path, _, parts in jobs}
+    failed = set()
+    out_paths = {}
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_translation_worker,
+        initargs=(threads,)
+    ) as pool:
+        futures = {}
+        # Les plus gros fichiers d'abord : la durée totale tend vers celle du plus gros
+        for file_path, file_src, parts in sorted(jobs, key=lambda job: -sum(len(part) for part in job[2])):
+            for index, part in enumerate(parts):
+                futures[pool.submit(_translate_part, part, file_src, tgt_lang)] = (file_path, index)
+
+        for future in as_completed(futures):
+            file_path, index = futures[future]
+            try:
+                results[file_path][index], delta = future.result()
+                for key, value in delta.items():
+                    translation_stats[key] += value
+            except Exception as e:
+                if file_path not in failed:
+                    logging.error(f"Erreur traduction {file_path} : {e}")
+                failed.add(file_path)
+
+            remaining[file_path] -= 1
+            if remaining[file_path] > 0:
+                continue
+            if file_path not in failed:
+                translated_text = " ".join(chunk for part in results[file_path] for chunk in part)
+                out_paths[file_path] = _write_translation(file_path, tgt_lang, output_dir, translated_text)
+            done += 1
+            logging.info(f"[{done}/{total}] Traduction terminée : {file_path}")
+            if progress_callback:
+                progress_callback(done, total, file_path)
+
+    return [out_paths[file_path] for file_path in file_paths if file_path in out_paths]
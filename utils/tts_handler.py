@@ -1,23 +1,384 @@
 import pyttsx3
 import os
 import time
+import queue
+import hashlib
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Iterable, Optional
 
-def text_to_speech(text: str, output_dir: str = "tts_output") -> str:
-    if not text.strip():
-        raise ValueError("Le texte est vide.")
-
-    os.makedirs(output_dir, exist_ok=True)
-    timestamp = int(time.time() * 1000)
-    filename = f"audio_{timestamp}.mp3"
-    output_path = os.path.join(output_dir, filename)
-
-    engine = pyttsx3.init()
-    # Réglages possibles, ex : vitesse, voix
-    engine.setProperty('rate', 150)
-    # Pour sauvegarder dans un fichier audio
-    engine.save_to_file(text, output_path)
-    engine.runAndWait()
-    engine.stop()
-
-    print(f"[✅ Audio généré localement : {output_path}]")
-    return output_path
+TTS_OUTPUT_DIR = "tts_output"
+TTS_RATE = 150
+# Taille maximale de tts_output ; au-delà, les fichiers les moins récemment servis sont supprimés
+TTS_DISK_BUDGET_MB = int(os.getenv("TTS_DISK_BUDGET_MB", 200))
+# Processus de synthèse (un moteur pyttsx3 chacun) et durée maximale d'une synthèse
+TTS_PROCESSES = int(os.getenv("TTS_PROCESSES", 2))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", 30))
+# Attente maximale dans la file avant le début de la synthèse
+TTS_QUEUE_TIMEOUT = float(os.getenv("TTS_QUEUE_TIMEOUT", 60))
+# Échecs de démarrage consécutifs (moteur absent...) avant de déclarer le service indisponible
+TTS_MAX_FAILED_STARTS = 3
+
+# Indices cherchés dans l'identifiant, le nom ou les langues des voix installées
+VOICE_HINTS = {
+    "fr": ["fr", "french", "français", "hortense"],
+    "en": ["en", "english", "zira", "david"],
+    "ar": ["ar", "arabic", "hoda", "naayf"],
+}
+# Voix imposée par langue (ex. TTS_VOICE_FR=<identifiant pyttsx3>), sinon choix automatique
+TTS_VOICES = {lang: os.getenv(f"TTS_VOICE_{lang.upper()}") for lang in VOICE_HINTS}
+
+_gc_lock = threading.Lock()
+_pinned = set()
+
+
+def _voice_matches(voice, hints) -> bool:
+    labels = [voice.id or "", voice.name or ""]
+    for language in getattr(voice, "languages", None) or []:
+        labels.append(language.decode(errors="ignore") if isinstance(language, bytes) else str(language))
+    labels = [label.lower() for label in labels]
+    return any(hint in label for hint in hints for label in labels)
+
+
+def select_voice(engine, lang: Optional[str]) -> Optional[str]:
+    """Identifiant de la voix installée correspondant à la langue (None : voix par défaut)."""
+    if TTS_VOICES.get(lang):
+        return TTS_VOICES[lang]
+    if lang not in VOICE_HINTS:
+        return None
+    return next(
+        (voice.id for voice in engine.getProperty('voices') if _voice_matches(voice, VOICE_HINTS[lang])),
+        None
+    )
+
+
+def audio_filename(text: str, lang: Optional[str], voice: Optional[str], rate: int = TTS_RATE) -> str:
+    """Nom de fichier dérivé du contenu : même texte, même voix -> même fichier."""
+    digest = hashlib.sha256("\x1f".join([text, lang or "", voice or "", str(rate)]).encode("utf-8")).hexdigest()
+    return f"tts_{digest[:32]}.mp3"
+
+
+def _tts_worker(tasks, results):
+    """Boucle d'un processus de synthèse : un seul moteur, réutilisé pour toutes les tâches."""
+    try:
+        engine = pyttsx3.init()
+        engine.setProperty('rate', TTS_RATE)
+        default_voice = engine.getProperty('voice')
+    except Exception as e:
+        # Pas de pilote de synthèse (espeak, SAPI...) : le parent doit le savoir
+        results.put(("init_failed", os.getpid(), f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", os.getpid()))
+    voices = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, text, lang, output_path = task
+        results.put(("start", task_id, os.getpid()))
+        start = time.perf_counter()
+        error = None
+        try:
+            if lang not in voices:
+                voices[lang] = select_voice(engine, lang)
+            # Voix par défaut rétablie si aucune ne correspond : sinon la voix de la tâche précédente resterait
+            voice = voices[lang] if voices[lang] is not None else default_voice
+            if voice is not None:
+                engine.setProperty('voice', voice)
+            # Écriture dans un fichier temporaire puis renommage : un fichier servi est toujours complet
+            temp_path = f"{output_path}.{os.getpid()}.tmp"
+            engine.save_to_file(text, temp_path)
+            engine.runAndWait()
+            os.replace(temp_path, output_path)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        results.put(("done", task_id, time.perf_counter() - start, error))
+
+
+class TTSService:
+    """
+    Pool de processus de synthèse vocale derrière une file de tâches.
+    Chaque processus possède son propre moteur pyttsx3 (non partageable entre
+    threads) ; un thread de répartition récupère les résultats, interrompt les
+    synthèses qui dépassent `timeout` et remplace les processus morts.
+    Les fichiers déjà synthétisés sont servis sans passer par les processus.
+    """
+
+    def __init__(self, processes: int = TTS_PROCESSES, timeout: float = TTS_TIMEOUT):
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._workers: Dict[int, Any] = {}
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._running: Dict[int, tuple] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ready_workers = set()
+        self._failed_starts = 0
+        self._broken: Optional[str] = None
+        self._last_start_error: Optional[str] = None
+        self.metrics = {
+            "requests": 0, "cache_hits": 0, "synthesized": 0, "timeouts": 0,
+            "errors": 0, "characters": 0, "synthesis_seconds": 0.0
+        }
+        self._started_at = time.monotonic()
+
+        for _ in range(self.processes):
+            self._spawn_worker()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="tts-dispatcher", daemon=True)
+        self._dispatcher.start()
+        print(f"[✅] Service TTS démarré ({self.processes} processus)")
+
+    def _spawn_worker(self):
+        process = self._context.Process(target=_tts_worker, args=(self._tasks, self._results), daemon=True)
+        process.start()
+        self._workers[process.pid] = process
+
+    def submit(self, text: str, lang: Optional[str] = None, output_dir: str = TTS_OUTPUT_DIR) -> Future:
+        text = text.strip()
+        if not text:
+            raise ValueError("Le texte est vide.")
+
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, audio_filename(text, lang, TTS_VOICES.get(lang) or "auto"))
+        with self._lock:
+            self.metrics["requests"] += 1
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                os.utime(output_path)  # date d'accès pour l'éviction LRU
+                self.metrics["cache_hits"] += 1
+                print(f"[⚡] Audio déjà synthétisé : {output_path}")
+                future = Future()
+                future.set_result(output_path)
+                return future
+            if self._broken is not None:
+                raise RuntimeError(f"Synthèse vocale indisponible : {self._broken}")
+            # Même texte déjà en cours de synthèse : on partage le résultat
+            if output_path in self._inflight:
+                return self._inflight[output_path]
+
+            task_id = next(self._ids)
+            future = Future()
+            self._pending[task_id] = {"future": future, "path": output_path, "chars": len(text)}
+            self._inflight[output_path] = future
+        self._tasks.put((task_id, text, lang, output_path))
+        return future
+
+    def synthesize(self, text: str, lang: Optional[str] = None, output_dir: str = TTS_OUTPUT_DIR) -> str:
+        future = self.submit(text, lang, output_dir)
+        try:
+            return future.result(timeout=TTS_QUEUE_TIMEOUT + self.timeout)
+        except FutureTimeoutError:
+            # Tâche abandonnée : un processus qui la prendrait plus tard n'aurait personne à prévenir
+            with self._lock:
+                task_id = next((tid for tid, task in self._pending.items() if task["future"] is future), None)
+                self.metrics["timeouts"] += 1
+            if task_id is not None:
+                self._fail(task_id, TimeoutError("Synthèse vocale : file d'attente saturée"))
+            raise TimeoutError(f"Synthèse vocale non terminée après {TTS_QUEUE_TIMEOUT + self.timeout:.0f}s")
+
+    def _dispatch(self):
+        while not self._closed:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError):
+                break
+            if message is not None:
+                self._handle(message)
+            self._check_workers()
+
+    def _handle(self, message):
+        if message[0] == "ready":
+            with self._lock:
+                self._ready_workers.add(message[1])
+                self._failed_starts = 0
+            return
+        if message[0] == "init_failed":
+            _, pid, error = message
+            print(f"[❌] Moteur de synthèse vocale indisponible (processus {pid}) : {error}")
+            with self._lock:
+                self._last_start_error = error
+            return
+        if message[0] == "start":
+            _, task_id, pid = message
+            with self._lock:
+                if task_id in self._pending:
+                    self._running[task_id] = (pid, time.monotonic())
+            return
+
+        _, task_id, seconds, error = message
+        with self._lock:
+            self._running.pop(task_id, None)
+            task = self._pending.pop(task_id, None)
+            if task is None:
+                return  # tâche déjà abandonnée (timeout)
+            self._inflight.pop(task["path"], None)
+            if error is None:
+                self.metrics["synthesized"] += 1
+                self.metrics["characters"] += task["chars"]
+                self.metrics["synthesis_seconds"] += seconds
+            else:
+                self.metrics["errors"] += 1
+
+        if error is None:
+            print(f"[✅ Audio généré localement : {task['path']} ({seconds:.2f}s)]")
+            task["future"].set_result(task["path"])
+            collect_garbage(os.path.dirname(task["path"]) or ".")
+        else:
+            print(f"[❌] Échec de la synthèse vocale : {error}")
+            task["future"].set_exception(RuntimeError(f"Synthèse vocale impossible : {error}"))
+
+    def _fail(self, task_id: int, error: Exception):
+        with self._lock:
+            self._running.pop(task_id, None)
+            task = self._pending.pop(task_id, None)
+            if task is None:
+                return
+            self._inflight.pop(task["path"], None)
+        task["future"].set_exception(error)
+
+    def _check_workers(self):
+        now = time.monotonic()
+        with self._lock:
+            running = list(self._running.items())
+        for task_id, (pid, started) in running:
+            process = self._workers.get(pid)
+            if now - started > self.timeout and process is not None and process.is_alive():
+                print(f"[⚠] Synthèse vocale interrompue après {self.timeout:.0f}s (processus {pid})")
+                process.terminate()
+                process.join(1)
+                with self._lock:
+                    self.metrics["timeouts"] += 1
+                self._fail(task_id, TimeoutError(f"Synthèse vocale trop longue (> {self.timeout:.0f}s)"))
+
+        for pid, process in list(self._workers.items()):
+            if process.is_alive() or self._closed:
+                continue
+            del self._workers[pid]
+            for task_id, (task_pid, _) in running:
+                if task_pid == pid:
+                    self._fail(task_id, RuntimeError("Processus de synthèse vocale arrêté"))
+            if pid in self._ready_workers:
+                self._ready_workers.discard(pid)
+            else:
+                # Mort avant d'être prêt : échec de démarrage
+                self._failed_starts += 1
+            if self._failed_starts >= TTS_MAX_FAILED_STARTS:
+                self._give_up(self._last_start_error or "les processus de synthèse ne démarrent pas")
+                return
+            self._spawn_worker()
+
+    def _give_up(self, error: str):
+        """Plus de relance : les tâches en attente échouent, les suivantes aussi, immédiatement."""
+        if self._broken is None:
+            print(f"[❌] Service TTS désactivé après {self._failed_starts} échecs de démarrage : {error}")
+        with self._lock:
+            self._broken = error
+            pending = list(self._pending)
+        for task_id in pending:
+            self._fail(task_id, RuntimeError(f"Synthèse vocale indisponible : {error}"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["queued"] = len(self._pending) - len(self._running)
+            metrics["running"] = len(self._running)
+        seconds = metrics["synthesis_seconds"]
+        metrics["processes"] = self.processes
+        metrics["available"] = self._broken is None
+        metrics["chars_per_second"] = round(metrics["characters"] / seconds, 1) if seconds else 0.0
+        metrics["syntheses_per_minute"] = round(metrics["synthesized"] * 60 / (time.monotonic() - self._started_at), 2)
+        metrics["synthesis_seconds"] = round(seconds, 2)
+        return metrics
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for process in self._workers.values():
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            pending = list(self._pending)
+        for task_id in pending:
+            self._fail(task_id, RuntimeError("Service TTS arrêté"))
+
+
+_service: Optional[TTSService] = None
+_service_lock = threading.Lock()
+
+
+def get_tts_service() -> TTSService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TTSService()
+        return _service
+
+
+def shutdown_tts_service():
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.shutdown()
+            _service = None
+
+
+def text_to_speech(text: str, lang: Optional[str] = None, output_dir: str = TTS_OUTPUT_DIR) -> str:
+    return get_tts_service().synthesize(text, lang, output_dir)
+
+
+def collect_garbage(output_dir: str = TTS_OUTPUT_DIR, budget_mb: float = TTS_DISK_BUDGET_MB) -> int:
+    """Supprime les fichiers audio les moins récemment utilisés au-delà du budget disque."""
+    with _gc_lock:
+        entries = []
+        for entry in os.scandir(output_dir):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        budget = budget_mb * 1024 * 1024
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= budget:
+                break
+            if os.path.basename(path) in _pinned:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            print(f"[🧹] {removed} fichier(s) audio supprimé(s) de {output_dir} ({total / 1024 / 1024:.1f} Mo restants)")
+        return removed
+
+
+def prerender_phrases(phrases: Dict[str, Iterable[str]], output_dir: str = TTS_OUTPUT_DIR) -> Dict[str, str]:
+    """
+    Synthétise à l'avance des phrases fixes {langue: [phrases]} ; leurs fichiers
+    ne sont jamais supprimés par collect_garbage.
+    """
+    start = time.perf_counter()
+    service = get_tts_service()
+    futures = {
+        text: service.submit(text, lang=lang, output_dir=output_dir)
+        for lang, texts in phrases.items()
+        for text in texts
+    }
+    rendered = {}
+    for text, future in futures.items():
+        rendered[text] = future.result(timeout=TTS_QUEUE_TIMEOUT + service.timeout)
+        _pinned.add(os.path.basename(rendered[text]))
+    print(f"[✅] {len(rendered)} phrase(s) fixe(s) pré-synthétisée(s) en {time.perf_counter() - start:.1f}s")
+    return rendered
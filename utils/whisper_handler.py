@@ -1,34 +1,125 @@
-import whisper
 import os
-from pydub import AudioSegment
-
-# Charger le modèle Whisper une seule fois
-WHISPER_MODEL = whisper.load_model("medium")  # ou "base", "small"
-
-def convert_to_wav_if_needed(audio_path):
-    ext = os.path.splitext(audio_path)[1].lower()
-    if ext != ".wav":
-        audio = AudioSegment.from_file(audio_path)
-        wav_path = os.path.splitext(audio_path)[0] + "_converted.wav"
-        
-        # Export en WAV PCM 16-bit mono, 16kHz
-        audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-        audio.export(wav_path, format="wav")
-        
-        print(f"[i] Audio converti en WAV (PCM 16kHz mono 16-bit) : {wav_path}")
-        return wav_path
-    return audio_path
-
-
-def transcribe_audio_simple(audio_path: str):
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Optional, Tuple, Union
+
+from utils.audio_frontend import prepare_audio, frame_energies, SAMPLE_RATE, VAD_ENERGY_THRESHOLD
+from utils.model_lifecycle import models
+
+# Moteur de transcription : "openai" (openai-whisper, fp32) ou "faster"
+# (faster-whisper / CTranslate2, quantifié int8 sur CPU)
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "openai")
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "medium")  # ou "base", "small"
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+
+
+class TranscriptionBackend(ABC):
+    """
+    Interface commune des moteurs de transcription (audio mono float32 16 kHz).
+    Un moteur incomplet échoue dès son instanciation (au chargement du modèle).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, audio: np.ndarray, language: Optional[str] = None, **options) -> Tuple[str, Optional[str]]:
+        """Retourne (texte, langue détectée)."""
+
+    @abstractmethod
+    def detect_language(self, audio: np.ndarray) -> str:
+        """Identification de la langue sur les 30 premières secondes."""
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    name = "openai"
+
+    def __init__(self, model_size: str = WHISPER_MODEL_SIZE):
+        import whisper  # import lourd (torch), différé au chargement du modèle
+        self.model_size = model_size
+        self.model = whisper.load_model(model_size)
+
+    def transcribe(self, audio, language=None, **options):
+        result = self.model.transcribe(audio, language=language, fp16=False, **options)
+        return result.get("text", "").strip(), result.get("language", None)
+
+    def detect_language(self, audio):
+        import whisper
+        segment = whisper.pad_or_trim(audio)  # 30 premières secondes
+        mel = whisper.log_mel_spectrogram(segment, n_mels=self.model.dims.n_mels).to(self.model.device)
+        _, probs = self.model.detect_language(mel)
+        return max(probs, key=probs.get)
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    name = "faster"
+
+    def __init__(self, model_size: str = WHISPER_MODEL_SIZE, compute_type: str = WHISPER_COMPUTE_TYPE, device: str = "cpu"):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError("faster-whisper n'est pas installé (pip install faster-whisper)") from e
+        self.model_size = model_size
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+
+    def transcribe(self, audio, language=None, **options):
+        segments, info = self.model.transcribe(audio, language=language, **options)
+        text = "".join(segment.text for segment in segments).strip()
+        return text, info.language
+
+    def detect_language(self, audio):
+        segment = audio[:30 * SAMPLE_RATE]
+        if hasattr(self.model, "detect_language"):
+            language, _, _ = self.model.detect_language(segment)
+            return language
+        # Versions plus anciennes : la langue est identifiée avant le décodage (segments paresseux)
+        _, info = self.model.transcribe(segment)
+        return info.language
+
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend
+}
+
+
+def create_backend(name: str = WHISPER_BACKEND, model_size: str = WHISPER_MODEL_SIZE) -> TranscriptionBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Moteur de transcription inconnu : {name} ({', '.join(BACKENDS)})")
+    return BACKENDS[name](model_size)
+
+
+# Moteur chargé une seule fois, en arrière-plan au démarrage
+models.register("whisper", create_backend)
+
+
+def get_transcriber() -> TranscriptionBackend:
+    return models.get("whisper")
+
+
+def detect_language(audio: np.ndarray) -> str:
+    """Identification rapide de la langue par Whisper (30 premières secondes)."""
+    return get_transcriber().detect_language(audio)
+
+
+def transcribe_audio_simple(audio: Union[str, np.ndarray], language: Optional[str] = None):
+    """
+    audio : chemin d'un fichier audio, ou signal déjà préparé par
+    utils.audio_frontend.prepare_audio (mono float32 16 kHz, silences retirés).
+    language : langue déjà identifiée ; sinon identifiée une fois par Whisper
+    et retournée pour être réutilisée par la suite du pipeline.
+    """
     try:
-        audio_path = convert_to_wav_if_needed(audio_path)
-        print(f"[i] Transcription du fichier audio : {audio_path}")
-        
-        result = WHISPER_MODEL.transcribe(audio_path, language="fr")  # langue forcée
-        
-        text = result.get("text", "").strip()
-        language = result.get("language", None)
+        if isinstance(audio, str):
+            print(f"[i] Transcription du fichier audio : {audio}")
+            audio = prepare_audio(audio)
+        if len(audio) == 0:
+            print("[⚠] Aucune parole détectée, transcription ignorée")
+            return "", None
+
+        transcriber = get_transcriber()
+        if language is None:
+            language = transcriber.detect_language(audio)
+        text, _ = transcriber.transcribe(audio, language=language)
 
         print(f"[🔊] Transcription Whisper : {text}")
         print(f"[🌐] Langue détectée par Whisper : {language}")
@@ -38,6 +129,101 @@ def transcribe_audio_simple(audio_path: str):
         print(f"[❌] Erreur transcription : {e}")
         return "", None
 
+
+# Parole minimale (en secondes) avant de figer la langue en streaming : sur
+# une fenêtre trop courte, l'identification de Whisper n'est pas fiable
+LANGUAGE_LOCK_SECONDS = 3.0
+
+
+class StreamingTranscriber:
+    """
+    Transcription incrémentale d'un flux audio (mono float32 16 kHz) :
+    le moteur de transcription est relancé sur une fenêtre glissante des dernières
+    window_seconds toutes les step_seconds de nouvel audio, et une fin de
+    parole est signalée après silence_seconds de silence suivant la parole.
+    """
+
+    FRAME_SAMPLES = int(SAMPLE_RATE * 0.03)  # trames de 30 ms pour la détection d'énergie
+
+    def __init__(
+        self,
+        window_seconds: float = 30.0,
+        step_seconds: float = 1.0,
+        silence_seconds: float = 0.8,
+        max_seconds: float = 60.0,
+        energy_threshold: float = VAD_ENERGY_THRESHOLD
+    ):
+        self.window_samples = int(window_seconds * SAMPLE_RATE)
+        self.step_samples = int(step_seconds * SAMPLE_RATE)
+        self.silence_samples = int(silence_seconds * SAMPLE_RATE)
+        self.max_samples = int(max_seconds * SAMPLE_RATE)
+        self.energy_threshold = energy_threshold
+        self._chunks = []
+        self._length = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._since_partial = 0
+        self._speech_started = False
+        self._trailing_silence = 0
+        self._voiced = 0
+        self.language: Optional[str] = None
+
+    @property
+    def audio(self) -> np.ndarray:
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.zeros(0, dtype=np.float32)
+
+    @property
+    def end_of_speech(self) -> bool:
+        if self._length >= self.max_samples:
+            return True
+        return self._speech_started and self._trailing_silence >= self.silence_samples
+
+    def feed(self, samples: np.ndarray) -> bool:
+        """Ajoute des échantillons ; retourne True si une transcription partielle est due."""
+        samples = np.asarray(samples, dtype=np.float32)
+        self._chunks.append(samples)
+        self._length += len(samples)
+        self._since_partial += len(samples)
+
+        # Détection de fin de parole par énergie, trame par trame
+        self._pending = np.concatenate([self._pending, samples])
+        energies = frame_energies(self._pending, self.FRAME_SAMPLES)
+        for energy in energies:
+            if energy >= self.energy_threshold:
+                self._speech_started = True
+                self._trailing_silence = 0
+                self._voiced += self.FRAME_SAMPLES
+            elif self._speech_started:
+                self._trailing_silence += self.FRAME_SAMPLES
+        self._pending = self._pending[len(energies) * self.FRAME_SAMPLES:]
+
+        return self._speech_started and self._since_partial >= self.step_samples
+
+    def next_window(self) -> np.ndarray:
+        """Fenêtre glissante à transcrire (à appeler depuis le même thread que feed)."""
+        self._since_partial = 0
+        return self.audio[-self.window_samples:]
+
+    def transcribe_window(self, window: np.ndarray) -> str:
+        """
+        Transcription partielle d'une fenêtre (appel bloquant). La langue est
+        ré-identifiée à chaque fenêtre tant qu'il y a moins de
+        LANGUAGE_LOCK_SECONDS de parole, puis figée et réutilisée (y compris
+        pour la transcription finale).
+        """
+        transcriber = get_transcriber()
+        language = self.language or transcriber.detect_language(window)
+        if self.language is None and self._voiced >= LANGUAGE_LOCK_SECONDS * SAMPLE_RATE:
+            self.language = language
+        text, _ = transcriber.transcribe(
+            window,
+            language=language,
+            condition_on_previous_text=False
+        )
+        return text
+
+
 '''
 if __name__ == "__main__":
     test_audio = "response_1753350310.mp3"